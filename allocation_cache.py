@@ -0,0 +1,203 @@
+"""
+Caches allocation results keyed on the content of the intermediate language.
+
+The key is a SHA-256 digest of a canonical encoding of every instruction, the color list and the options passed to
+``allocate``, so an unchanged function hits the cache however it was constructed. Results are kept in an in-memory
+LRU tier and, when a directory is given, in an on-disk tier of JSON files shared between processes. The on-disk tier
+evicts the least recently used files once it grows past ``max_bytes``.
+
+Pass a ``seed`` in the options to make a cached result identical to what a fresh allocation would produce.
+"""
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from register_allocation import Dec, Use, Instruction, IntermediateLanguage, ControlFlowGraph, Graph, allocate
+
+# Options that only observe an allocation and never change its result
+_IGNORED_OPTIONS = {'visualize', 'stats'}
+
+# Options left out of a call take these values, so they are filled in before hashing
+_DEFAULT_OPTIONS = {name: parameter.default for name, parameter in inspect.signature(allocate).parameters.items()
+                    if parameter.default is not parameter.empty and name not in _IGNORED_OPTIONS}
+
+_SUFFIX = '.json'
+
+
+def _encode_instruction(instruction: Instruction) -> List:
+    return [
+        instruction.opcode,
+        instruction.frequency,
+        [[dec.reg, dec.dead] for dec in instruction.dec],
+        [[use.reg, use.dead] for use in instruction.use],
+        instruction.rematerializable
+    ]
+
+
+def _decode_instruction(encoded: List) -> Instruction:
+    opcode, frequency, decs, uses, rematerializable = encoded
+    return Instruction(opcode, [Dec(reg, dead) for reg, dead in decs], [Use(reg, dead) for reg, dead in uses],
+                       frequency, rematerializable)
+
+
+def _encode_option(value):
+    if isinstance(value, ControlFlowGraph):
+        return value.successors
+    return value
+
+
+def il_hash(il: IntermediateLanguage, colors: List[str], **options) -> str:
+    """
+    :return: The hex digest identifying an allocation of ``il`` with ``colors`` and the ``allocate`` options. An
+        option passed with its default value gives the same digest as leaving it out.
+    """
+    options = dict(_DEFAULT_OPTIONS, **options)
+    digest = hashlib.sha256()
+    digest.update(json.dumps([list(colors), sorted(
+        (name, _encode_option(value)) for name, value in options.items() if name not in _IGNORED_OPTIONS)]).encode())
+
+    # One JSON line per instruction keeps the encoding unambiguous without building it all in memory
+    for instruction in il.instructions:
+        digest.update(b'\n')
+        digest.update(json.dumps(_encode_instruction(instruction)).encode())
+
+    return digest.hexdigest()
+
+
+class CachedAllocation:
+    """
+    The rewritten instructions and the coloring, or None, produced by one allocation.
+    """
+
+    def __init__(self, instructions: List, coloring: Optional[Dict[str, str]]):
+        self.instructions = instructions
+        self.coloring = coloring
+
+    @classmethod
+    def from_result(cls, il: IntermediateLanguage, coloring: Optional[Dict[str, str]]) -> 'CachedAllocation':
+        return cls([_encode_instruction(instruction) for instruction in il.instructions],
+                   None if coloring is None else dict(coloring))
+
+    def to_il(self) -> IntermediateLanguage:
+        return IntermediateLanguage([_decode_instruction(encoded) for encoded in self.instructions])
+
+
+class AllocationCache:
+    """
+    A two tier cache of allocation results.
+
+    :param capacity: The number of results kept in memory
+    :param directory: Optional directory for the on-disk tier, created if missing
+    :param max_bytes: The size the on-disk tier is trimmed back to after every store
+    """
+
+    def __init__(self, capacity: int = 1024, directory: Optional[str] = None, max_bytes: int = 256 * 1024 * 1024):
+        self.capacity = capacity
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory: 'OrderedDict[str, CachedAllocation]' = OrderedDict()
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def _remember(self, key: str, entry: CachedAllocation) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[CachedAllocation]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+
+        if self.directory is None:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            # Reading counts as a use for eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        entry = CachedAllocation(data['instructions'], data['coloring'])
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, entry: CachedAllocation) -> None:
+        self._remember(key, entry)
+        if self.directory is None:
+            return
+
+        # Written to a temporary file and renamed so concurrent readers never see a partial entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                json.dump({'instructions': entry.instructions, 'coloring': entry.coloring}, file)
+            os.replace(temporary, self._path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.name.endswith(_SUFFIX):
+                    stat = item.stat()
+                    entries.append((stat.st_mtime, item.path, stat.st_size))
+                    total += stat.st_size
+
+        entries.sort()
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self.directory is not None:
+            with os.scandir(self.directory) as scan:
+                for item in scan:
+                    if item.name.endswith(_SUFFIX):
+                        os.unlink(item.path)
+
+    def allocate(self, il: IntermediateLanguage, colors: List[str],
+                 **options) -> Tuple[Optional[Graph], Optional[Dict[str, str]]]:
+        """
+        ``allocate`` through the cache.
+
+        On a hit ``il`` is overwritten with the cached rewritten instructions and no interference graph is built, so
+        the returned graph is None and a visualization hook is not called.
+        """
+        key = il_hash(il, colors, **options)
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            il.overwrite_il(entry.to_il().instructions)
+            return None, None if entry.coloring is None else dict(entry.coloring)
+
+        self.misses += 1
+        graph, coloring = allocate(il, colors, **options)
+        self.put(key, CachedAllocation.from_result(il, coloring))
+        return graph, coloring
@@ -0,0 +1,181 @@
+"""
+Allocates registers for many independent functions across a pool of worker processes.
+"""
+import multiprocessing
+import signal
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Iterator, List, Optional, Dict
+
+from register_allocation import IntermediateLanguage, Graph, allocate
+
+
+class AllocationTimeout(Exception):
+    pass
+
+
+class BatchResult:
+    """
+    The outcome of allocating one function of a batch.
+
+    ``index`` is the position of the function in the input. On success ``il`` is the rewritten intermediate language
+    and ``graph`` and ``coloring`` are what ``allocate`` returned. On failure ``error`` holds a description of the
+    exception raised by the worker, or of the timeout.
+    """
+
+    def __init__(self,
+                 index: int,
+                 il: Optional[IntermediateLanguage] = None,
+                 graph: Optional[Graph] = None,
+                 coloring: Optional[Dict[str, str]] = None,
+                 error: Optional[str] = None,
+                 elapsed: float = 0.0):
+        self.index = index
+        self.il = il
+        self.graph = graph
+        self.coloring = coloring
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+# Set in every worker of a pool, one flag per function of the batch marking the functions a worker has started
+_started = None
+
+
+def _init_worker(started) -> None:
+    global _started
+    _started = started
+
+
+def _raise_timeout(signum, frame):
+    raise AllocationTimeout()
+
+
+def _allocate_one(index: int, il: IntermediateLanguage, colors: List[str], timeout: Optional[float],
+                  options: Dict) -> BatchResult:
+    if _started is not None:
+        _started[index] = 1
+
+    # The timeout is enforced inside the worker so a slow function is abandoned without tearing down the pool.
+    # Platforms without setitimer run without a timeout.
+    use_timer = timeout is not None and hasattr(signal, 'setitimer')
+    if use_timer:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    start = time.perf_counter()
+    try:
+        graph, coloring = allocate(il, colors, **options)
+        return BatchResult(index, il, graph, coloring, elapsed=time.perf_counter() - start)
+    except AllocationTimeout:
+        return BatchResult(index, error='timed out after {} seconds'.format(timeout),
+                           elapsed=time.perf_counter() - start)
+    except Exception:
+        return BatchResult(index, error=traceback.format_exc(), elapsed=time.perf_counter() - start)
+    finally:
+        if use_timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _run_pool(ils: Dict[int, IntermediateLanguage],
+              colors: List[str],
+              processes: Optional[int],
+              timeout: Optional[float],
+              options: Dict,
+              size: int,
+              broken: Dict[int, bool]) -> Iterator[BatchResult]:
+    """
+    Allocates ``ils`` on a new pool and yields the results as they finish.
+
+    When a worker dies the pool breaks and every function that has not finished is added to ``broken``, mapped to
+    whether a worker had started it.
+    """
+    started = multiprocessing.Array('b', size, lock=False)
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(started,)) as executor:
+        futures = {executor.submit(_allocate_one, index, il, colors, timeout, options): index
+                   for index, il in ils.items()}
+
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                broken[index] = bool(started[index])
+                continue
+            except Exception as error:
+                result = BatchResult(index, error='worker failed: {!r}'.format(error))
+            yield result
+
+
+def _allocate_all(ils: Dict[int, IntermediateLanguage],
+                  colors: List[str],
+                  processes: Optional[int],
+                  timeout: Optional[float],
+                  options: Dict) -> Iterator[BatchResult]:
+    """
+    Allocates ``ils`` and yields the results as they finish, starting a new pool whenever a worker crashes.
+    """
+    queue = dict(ils)
+    suspects = []
+
+    while queue or suspects:
+        if suspects:
+            index = suspects.pop(0)
+            batch, workers = {index: ils[index]}, 1
+        else:
+            batch, workers, queue = queue, processes, {}
+
+        broken = {}
+        yield from _run_pool(batch, colors, workers, timeout, options, len(ils), broken)
+
+        # Alone on its pool, a function that breaks it is the one that crashed. A pool that broke before starting
+        # anything would break again.
+        if workers == 1 or not any(broken.values()):
+            for index in broken:
+                yield BatchResult(index, error='worker failed: the worker process died')
+        else:
+            suspects.extend(index for index, started in broken.items() if started)
+            queue.update((index, ils[index]) for index, started in broken.items() if not started)
+
+
+def allocate_batch(ils: Iterable[IntermediateLanguage],
+                   colors: List[str],
+                   processes: Optional[int] = None,
+                   timeout: Optional[float] = None,
+                   ordered: bool = False,
+                   **options) -> Iterator[BatchResult]:
+    """
+    Allocates every intermediate language in ``ils`` with ``allocate`` on a process pool.
+
+    Results are yielded as soon as they finish, or in input order when ``ordered`` is set. A function that raises,
+    times out or crashes its worker is reported through ``BatchResult.error`` and the rest of the batch continues.
+
+    A crashed worker breaks the whole pool. The functions that had not started yet are resubmitted to a new pool and
+    the ones that were running are each retried alone on a pool of one worker, so only a function that crashes its
+    worker by itself is reported as failed.
+
+    :param ils: The functions to allocate
+    :param colors: Possible colors, shared by every function
+    :param processes: Number of worker processes, defaults to the number of CPUs
+    :param timeout: Per-function time limit in seconds
+    :param ordered: Yield results in input order instead of completion order
+    :param options: Extra keyword arguments passed to ``allocate``
+    """
+    results = _allocate_all(dict(enumerate(ils)), colors, processes, timeout, options)
+    if not ordered:
+        yield from results
+        return
+
+    finished = {}
+    next_index = 0
+    for result in results:
+        finished[result.index] = result
+        while next_index in finished:
+            yield finished.pop(next_index)
+            next_index += 1
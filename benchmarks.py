@@ -0,0 +1,278 @@
+"""
+Benchmarks the phases of the allocator on synthetic intermediate language.
+
+Every generator takes a number of symbolic registers and a seed and returns a valid ``IntermediateLanguage``: each use
+reads a live register and liveness stays close to a target register pressure. Results are written as JSON lines, one
+record per generator and size, holding the wall time and peak traced memory of each phase::
+
+    python benchmarks.py --sizes 10 100 1000 --output before.jsonl
+    python benchmarks.py --sizes 10 100 1000 --output after.jsonl --compare before.jsonl
+
+``--allocators`` also runs ``allocate`` end to end with each allocator and records its time and spill counts, so
+the allocators can be compared side by side.
+"""
+import argparse
+import contextlib
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import register_allocation
+from register_allocation import Dec, Use, Instruction, IntermediateLanguage
+
+PHASES = ['build_graph', 'coalesce_nodes', 'color_graph', 'decide_spills', 'insert_spill_code']
+ALLOCATORS = list(register_allocation.ALLOCATORS)
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+
+
+class _Generator:
+    """
+    Emits random instructions while tracking which registers are live so the result is valid IL.
+    """
+
+    def __init__(self, seed: int, pressure: int, copy_ratio: float = 0.0):
+        self.rng = random.Random(seed)
+        self.pressure = pressure
+        self.copy_ratio = copy_ratio
+        self.live = []
+        self.instructions = []
+        self.registers = 0
+
+    def new_register(self) -> str:
+        self.registers += 1
+        return 'r{}'.format(self.registers)
+
+    def block(self, frequency=1) -> None:
+        while len(self.live) < self.pressure // 2:
+            self.live.append(self.new_register())
+        self.instructions.append(Instruction('bb', [Dec(reg, False) for reg in self.live], [], frequency))
+
+    def instruction(self) -> None:
+        is_copy = self.rng.random() < self.copy_ratio
+        sources = self.rng.sample(self.live, 1 if is_copy or len(self.live) < 2 else 2)
+        target = self.new_register()
+
+        # Kill sources to keep liveness near the target pressure. Copies kill their source most of the time so the
+        # coalescer has work to do.
+        uses = []
+        for source in sources:
+            dead = len(self.live) >= self.pressure or (is_copy and self.rng.random() < 0.8)
+            if dead:
+                self.live.remove(source)
+            uses.append(Use(source, dead))
+
+        self.live.append(target)
+        opcode = 'copy' if is_copy else 'op'
+        self.instructions.append(Instruction(opcode, [Dec(target, False)], uses))
+
+    def il(self) -> IntermediateLanguage:
+        # One use per instruction, so the end of the function never needs more than one register at a time
+        for reg in self.live:
+            self.instructions.append(Instruction('sink', [], [Use(reg, True)]))
+        return IntermediateLanguage(self.instructions)
+
+
+def straight_line_il(registers: int, seed: int = 0) -> IntermediateLanguage:
+    """
+    A single basic block of arithmetic with moderate register pressure.
+    """
+    generator = _Generator(seed, pressure=8)
+    generator.block()
+    while generator.registers < registers:
+        generator.instruction()
+    return generator.il()
+
+
+def copy_heavy_il(registers: int, seed: int = 0) -> IntermediateLanguage:
+    """
+    A single basic block where half of the instructions are copies.
+    """
+    generator = _Generator(seed, pressure=8, copy_ratio=0.5)
+    generator.block()
+    while generator.registers < registers:
+        generator.instruction()
+    return generator.il()
+
+
+def high_pressure_il(registers: int, seed: int = 0) -> IntermediateLanguage:
+    """
+    Basic blocks of 100 instructions that keep 48 registers live.
+    """
+    generator = _Generator(seed, pressure=48)
+    while generator.registers < registers:
+        generator.block()
+        for _ in range(100):
+            generator.instruction()
+    return generator.il()
+
+
+def many_block_il(registers: int, seed: int = 0) -> IntermediateLanguage:
+    """
+    Many short basic blocks with random frequencies, with live registers carried across block boundaries.
+    """
+    generator = _Generator(seed, pressure=12, copy_ratio=0.1)
+    while generator.registers < registers:
+        generator.block(frequency=generator.rng.choice([0.1, 0.5, 1, 2, 10]))
+        for _ in range(generator.rng.randint(2, 10)):
+            generator.instruction()
+    return generator.il()
+
+
+GENERATORS: Dict[str, Callable[[int, int], IntermediateLanguage]] = {
+    'straight_line': straight_line_il,
+    'copy_heavy': copy_heavy_il,
+    'high_pressure': high_pressure_il,
+    'many_block': many_block_il,
+}
+
+
+def _run_phases(il: IntermediateLanguage, colors: List[str], measure) -> Dict[str, float]:
+    results = {}
+
+    graph = measure(results, 'build_graph', lambda: register_allocation.build_graph(il))
+    measure(results, 'coalesce_nodes', lambda: register_allocation.coalesce_nodes(il, graph))
+    registers = il.registers()
+    measure(results, 'color_graph', lambda: register_allocation.color_graph(graph, registers, colors))
+    cost = register_allocation.estimate_spill_costs(il)
+    spilled = measure(results, 'decide_spills', lambda: register_allocation.decide_spills(il, graph, colors, cost))
+    measure(results, 'insert_spill_code', lambda: register_allocation.insert_spill_code(il, spilled))
+
+    return results
+
+
+def _measure_time(results, phase, f):
+    start = time.perf_counter()
+    value = f()
+    results[phase] = time.perf_counter() - start
+    return value
+
+
+def _measure_memory(results, phase, f):
+    tracemalloc.start()
+    try:
+        value = f()
+        results[phase] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return value
+
+
+def run_case(generator: str, registers: int, colors: int = 8, seed: int = 0, memory: bool = True) -> Dict:
+    """
+    Benchmarks one generator at one size.
+
+    Timing and memory are measured in separate runs on freshly generated IL because tracing allocations slows the
+    phases down considerably.
+    """
+    color_list = ['c{}'.format(i) for i in range(colors)]
+    il = GENERATORS[generator](registers, seed)
+    record = {
+        'generator': generator,
+        'registers': len(il.registers()),
+        'instructions': len(il.instructions),
+        'colors': colors,
+        'seed': seed,
+        'seconds': _run_phases(il, color_list, _measure_time),
+    }
+
+    if memory:
+        il = GENERATORS[generator](registers, seed)
+        record['peak_bytes'] = _run_phases(il, color_list, _measure_memory)
+
+    return record
+
+
+def run_allocators(generator: str, registers: int, colors: int = 8, seed: int = 0,
+                   allocators: Optional[List[str]] = None) -> Dict[str, Dict]:
+    """
+    Allocates one generated function with each allocator.
+
+    :return: For each allocator, the wall time and the spill and coalescing counters of ``AllocationStats``
+    """
+    color_list = ['c{}'.format(i) for i in range(colors)]
+    results = {}
+
+    for allocator in allocators or ALLOCATORS:
+        il = GENERATORS[generator](registers, seed)
+        stats = register_allocation.AllocationStats()
+        start = time.perf_counter()
+        _, coloring = register_allocation.allocate(il, color_list, stats=stats, allocator=allocator, seed=seed)
+        results[allocator] = {
+            'seconds': time.perf_counter() - start,
+            'colored': coloring is not None,
+            'spill_rounds': stats.spill_rounds,
+            'reloads': stats.reloads_inserted,
+            'spills': stats.spills_inserted,
+            'coalesced': stats.coalesce_iterations,
+        }
+
+    return results
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline: List[Dict], current: List[Dict]) -> List[str]:
+    """
+    :return: One line per phase present in both runs with the ratio of current to baseline time
+    """
+    lines = []
+    previous = {(record['generator'], record['registers']): record for record in baseline}
+
+    for record in current:
+        old = previous.get((record['generator'], record['registers']))
+        if old is None:
+            continue
+        for phase in PHASES:
+            if old['seconds'].get(phase) and phase in record['seconds']:
+                lines.append('{:<14} {:>7} {:<18} {:6.2f}x'.format(
+                    record['generator'], record['registers'], phase,
+                    record['seconds'][phase] / old['seconds'][phase]))
+
+    return lines
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--generators', nargs='+', choices=sorted(GENERATORS), default=sorted(GENERATORS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES)
+    parser.add_argument('--colors', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced peak memory run')
+    parser.add_argument('--allocators', nargs='+', choices=ALLOCATORS, help='also allocate end to end with these')
+    parser.add_argument('--output', help='write JSON lines here instead of stdout')
+    parser.add_argument('--compare', help='JSON lines from an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    environment = {'commit': _commit(), 'python': platform.python_version()}
+    records = []
+    for generator in args.generators:
+        for size in args.sizes:
+            record = run_case(generator, size, args.colors, args.seed, not args.no_memory)
+            if args.allocators:
+                record['allocators'] = run_allocators(generator, size, args.colors, args.seed, args.allocators)
+            record.update(environment)
+            records.append(record)
+
+    with open(args.output, 'w', encoding='utf-8') if args.output else contextlib.nullcontext(sys.stdout) as output:
+        for record in records:
+            output.write(json.dumps(record, sort_keys=True) + '\n')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = [json.loads(line) for line in file if line.strip()]
+        print('\n'.join(compare(baseline, records)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
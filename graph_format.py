@@ -0,0 +1,344 @@
+"""
+On-disk formats for the interference graph, with an optional coloring and spill set.
+
+The binary form is compressed sparse row (CSR). Nodes are numbered in sorted label order and every section is a
+little endian array aligned to 8 bytes, laid out after ``CSR_MAGIC`` and a header holding the node, entry and color
+counts:
+
+* ``offsets``: node count + 1 uint64 values, the neighbors of node ``i`` are ``targets[offsets[i]:offsets[i + 1]]``
+* ``targets``: one uint32 node number per direction of every edge, sorted within each row
+* ``colors``: one int32 per node indexing the color names, -1 for an uncolored node
+* ``spilled``: one byte per node, 1 when the node is in the spill set
+* ``strings``: node count + color count + 1 uint64 offsets into the UTF-8 bytes of the node labels then the color names
+
+``CSRGraph`` memory maps the file and reads these arrays in place, so opening a graph costs the same whatever its
+size and queries only touch the pages they need.
+
+The edge list form is line oriented text for interop with other tools. The first line is the header ``#edges 1``,
+a line with two tab separated fields is an edge and a line with three fields describes a node: its label, its color
+(empty if uncolored, so color names must not be empty) and ``spilled`` or nothing. Labels and color names use
+``il_format.escape``::
+
+    #edges 1
+    a	b
+    a	c
+    a	red
+    b	blue
+    c		spilled
+"""
+import io
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from il_format import escape, unescape
+from register_allocation import Graph, SetAdjacency
+
+CSR_MAGIC = b'\x89CSR\r\n\x1a\n'
+EDGE_LIST_HEADER = '#edges 1'
+
+_HEADER = struct.Struct('<IIQQQ')
+_VERSION = 1
+_ALIGNMENT = 8
+
+
+def _padding(size: int) -> bytes:
+    return b'\0' * (-size % _ALIGNMENT)
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _node_labels(graph: Graph, coloring: Optional[Dict], spilled: Optional[Set]) -> List:
+    # Registers without interference only appear in the coloring or spill set, they are kept as isolated nodes
+    labels = set(graph.nodes())
+    labels.update(coloring or ())
+    labels.update(spilled or ())
+    return sorted(labels)
+
+
+def write_csr(graph: Graph, path: str, coloring: Optional[Dict[str, str]] = None,
+              spilled: Optional[Set[str]] = None) -> None:
+    """
+    Writes ``graph`` in the binary CSR form.
+    """
+    labels = _node_labels(graph, coloring, spilled)
+    ids = {label: node_id for node_id, label in enumerate(labels)}
+    rows = (sorted(ids[neighbor] for neighbor in graph.neighbors(label)) for label in labels)
+    _write_csr(path, labels, rows, coloring, spilled)
+
+
+def _write_csr(path: str, labels: List, rows: Iterable[Sequence[int]], coloring: Optional[Dict],
+               spilled: Optional[Set]) -> None:
+    """
+    Writes a CSR file from the sorted neighbor numbers of each node, produced in node order.
+
+    Rows are written as they are produced and the header and offsets are filled in once the edge count is known, so
+    only the offsets, labels and color names are held in memory.
+    """
+    coloring = coloring or {}
+    spilled = spilled or set()
+    color_names = sorted(set(coloring.values()))
+    color_ids = {color: color_id for color_id, color in enumerate(color_names)}
+    offsets_size = struct.calcsize('Q') * (len(labels) + 1)
+
+    with open(path, 'wb') as file:
+        file.write(CSR_MAGIC)
+        file.seek(_HEADER.size + offsets_size + len(_padding(offsets_size)), io.SEEK_CUR)
+
+        offsets = array('Q', [0])
+        for row in rows:
+            targets = array('I', row)
+            file.write(_little_endian(targets))
+            offsets.append(offsets[-1] + len(targets))
+        if len(offsets) != len(labels) + 1:
+            raise ValueError('expected {} rows, found {}'.format(len(labels), len(offsets) - 1))
+        file.write(_padding(struct.calcsize('I') * offsets[-1]))
+
+        colors = array('i', [color_ids.get(coloring.get(label), -1) for label in labels])
+        spill_flags = bytes(label in spilled for label in labels)
+
+        string_offsets = array('Q', [0])
+        string_data = bytearray()
+        for text in labels + color_names:
+            string_data += str(text).encode('utf-8')
+            string_offsets.append(len(string_data))
+
+        for section in [_little_endian(colors), spill_flags, _little_endian(string_offsets), bytes(string_data)]:
+            file.write(section)
+            file.write(_padding(len(section)))
+
+        file.seek(len(CSR_MAGIC))
+        file.write(_HEADER.pack(_VERSION, 0, len(labels), offsets[-1], len(color_names)))
+        file.write(_little_endian(offsets))
+
+
+class CSRGraph:
+    """
+    A read-only interference graph backed by a memory mapped CSR file.
+
+    Node queries take labels like ``Graph``. ``neighbor_ids`` gives direct access to the mapped rows by node number
+    for passes that want to avoid decoding labels; release those views before closing the graph, or use it as a
+    context manager, to unmap the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if self._map[:len(CSR_MAGIC)] != CSR_MAGIC:
+                raise ValueError('{}: not a CSR graph file'.format(path))
+            version, _, self._node_count, entry_count, color_count = _HEADER.unpack_from(self._map, len(CSR_MAGIC))
+            if version != _VERSION:
+                raise ValueError('{}: unsupported CSR version {}'.format(path, version))
+
+            self._view = memoryview(self._map)
+            offset = len(CSR_MAGIC) + _HEADER.size
+            self._offsets, offset = self._section(offset, 'Q', self._node_count + 1)
+            self._targets, offset = self._section(offset, 'I', entry_count)
+            self._colors, offset = self._section(offset, 'i', self._node_count)
+            self._spilled, offset = self._section(offset, 'B', self._node_count)
+            self._string_offsets, offset = self._section(offset, 'Q', self._node_count + color_count + 1)
+            self._strings = self._view[offset:offset + self._string_offsets[-1]]
+            self._color_names = [self._string(self._node_count + i) for i in range(color_count)]
+        except Exception:
+            self.close()
+            raise
+
+        self._ids: Optional[Dict[str, int]] = None
+
+    def _section(self, offset: int, typecode: str, count: int):
+        size = struct.calcsize(typecode) * count
+        if offset + size > len(self._map):
+            raise ValueError('{}: truncated CSR graph file'.format(self.path))
+
+        data = self._view[offset:offset + size]
+        if sys.byteorder == 'big' and typecode != 'B':
+            # The file is little endian, a big endian host reads a byte swapped copy instead of the mapping
+            values = array(typecode)
+            values.frombytes(data)
+            values.byteswap()
+            data = memoryview(values)
+        else:
+            data = data.cast(typecode)
+        return data, offset + size + (-size % _ALIGNMENT)
+
+    def _string(self, index: int) -> str:
+        return str(self._strings[self._string_offsets[index]:self._string_offsets[index + 1]], 'utf-8')
+
+    def close(self) -> None:
+        for name in ['_offsets', '_targets', '_colors', '_spilled', '_string_offsets', '_strings', '_view']:
+            view = self.__dict__.pop(name, None)
+            if isinstance(view, memoryview):
+                view.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._node_count
+
+    def label(self, node_id: int) -> str:
+        return self._string(node_id)
+
+    def _index(self) -> Dict[str, int]:
+        # Built on first use so opening a file never decodes every label
+        if self._ids is None:
+            self._ids = {self._string(node_id): node_id for node_id in range(self._node_count)}
+        return self._ids
+
+    def node_id(self, label) -> Optional[int]:
+        """
+        :return: The node number of ``label`` or None if it is not in the graph
+        """
+        return self._index().get(label)
+
+    def neighbor_ids(self, node_id: int) -> memoryview:
+        return self._targets[self._offsets[node_id]:self._offsets[node_id + 1]]
+
+    def contains_edge(self, x, y) -> bool:
+        x_id = self.node_id(x)
+        y_id = self.node_id(y)
+        if x_id is None or y_id is None:
+            return False
+
+        row = self.neighbor_ids(x_id)
+        position = bisect_left(row, y_id)
+        return position < len(row) and row[position] == y_id
+
+    def neighbors(self, x) -> List[str]:
+        node_id = self.node_id(x)
+        if node_id is None:
+            return []
+        return [self._string(y) for y in self.neighbor_ids(node_id)]
+
+    def degree(self, x) -> int:
+        node_id = self.node_id(x)
+        if node_id is None:
+            return 0
+        return self._offsets[node_id + 1] - self._offsets[node_id]
+
+    def nodes(self) -> Iterator[str]:
+        return (self._string(node_id) for node_id in range(self._node_count))
+
+    def edge_count(self) -> int:
+        return len(self._targets) // 2
+
+    def edges(self) -> Iterator[Tuple[str, str]]:
+        """
+        Yields every edge once as an ``(x, y)`` tuple.
+        """
+        for x in range(self._node_count):
+            row = self.neighbor_ids(x)
+            for y in row[bisect_left(row, x + 1):]:
+                yield self._string(x), self._string(y)
+
+    @property
+    def coloring(self) -> Dict[str, str]:
+        return {self._string(node_id): self._color_names[color]
+                for node_id, color in enumerate(self._colors) if color >= 0}
+
+    @property
+    def spilled(self) -> Set[str]:
+        return {self._string(node_id) for node_id, flag in enumerate(self._spilled) if flag}
+
+    def to_graph(self, backend=SetAdjacency) -> Graph:
+        """
+        Copies the file into an in-memory ``Graph``. Isolated nodes are kept.
+        """
+        graph = Graph(backend)
+        labels = [self._string(node_id) for node_id in range(self._node_count)]
+        for x, label in enumerate(labels):
+            graph.add_edges(label, [labels[y] for y in self.neighbor_ids(x)])
+        return graph
+
+
+def read_csr(path: str, backend=SetAdjacency) -> Tuple[Graph, Dict[str, str], Set[str]]:
+    """
+    Reads a whole CSR file into memory.
+
+    :return: The graph, the coloring and the spill set
+    """
+    with CSRGraph(path) as csr:
+        return csr.to_graph(backend), csr.coloring, csr.spilled
+
+
+def write_edge_list(graph: Graph, path: str, coloring: Optional[Dict[str, str]] = None,
+                    spilled: Optional[Set[str]] = None) -> None:
+    """
+    Writes ``graph`` in the edge list form, one edge at a time. An empty color name would read back as an uncolored
+    node, so it raises ``ValueError``.
+    """
+    coloring = coloring or {}
+    spilled = spilled or set()
+    if '' in coloring.values():
+        raise ValueError('empty color names cannot be written to an edge list')
+
+    with open(path, 'w', encoding='utf-8', newline='\n') as file:
+        file.write(EDGE_LIST_HEADER + '\n')
+        for x, y in graph.edges():
+            file.write(escape(x) + '\t' + escape(y) + '\n')
+
+        for label in _node_labels(graph, coloring, spilled):
+            if label in coloring or label in spilled or graph.degree(label) == 0:
+                file.write('\t'.join([
+                    escape(label),
+                    escape(coloring[label]) if label in coloring else '',
+                    'spilled' if label in spilled else ''
+                ]) + '\n')
+
+
+def read_edge_list_records(path: str) -> Iterator[Tuple[str, ...]]:
+    """
+    Streams the records of an edge list file: ``(x, y)`` for an edge and ``(label, color, flag)`` for a node.
+    """
+    with open(path, 'r', encoding='utf-8', newline='\n') as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.rstrip('\n')
+            if line == '' or line.startswith('#'):
+                continue
+
+            fields = line.split('\t')
+            if len(fields) not in (2, 3):
+                raise ValueError('{}:{}: expected 2 or 3 tab separated fields, found {}'.format(
+                    path, line_number, len(fields)))
+            if len(fields) == 3 and fields[2] not in ('', 'spilled'):
+                raise ValueError('{}:{}: unknown node flag {!r}'.format(path, line_number, fields[2]))
+
+            yield tuple(unescape(field) for field in fields)
+
+
+def read_edge_list(path: str, backend=SetAdjacency) -> Tuple[Graph, Dict[str, str], Set[str]]:
+    """
+    :return: The graph, the coloring and the spill set
+    """
+    graph = Graph(backend)
+    coloring = {}
+    spilled = set()
+
+    for record in read_edge_list_records(path):
+        if len(record) == 2:
+            graph.add_edge(*record)
+            continue
+
+        label, color, flag = record
+        graph.add_edges(label, [])
+        if color:
+            coloring[label] = color
+        if flag:
+            spilled.add(label)
+
+    return graph, coloring, spilled
@@ -0,0 +1,266 @@
+"""
+On-disk formats for the intermediate language.
+
+The text form is line oriented. The first non-blank line is the header ``#il 1`` and every other line holds one
+instruction as four tab separated fields: the opcode, the frequency, the decs and the uses, followed by a fifth field
+``remat`` for a rematerializable instruction. Operands are separated by spaces and a dead operand is prefixed with
+``!``. Backslash escapes (``\\\\``, ``\\t``, ``\\n``, ``\\r``, ``\\s`` for a space, and ``\\!`` and ``\\#`` for a
+leading ``!`` or ``#``) keep arbitrary opcodes and register names on one line. Blank lines and lines starting with ``#``
+are ignored::
+
+    #il 1
+    bb	1	a b
+    c := a + b	1	c	!a b
+
+The binary form starts with ``BINARY_MAGIC`` and is a sequence of records. A string record (``S``, a little endian
+uint32 length and UTF-8 bytes) defines the next string ID. An instruction record (``I``) holds the opcode string ID,
+the frequency as a double, the dec and use counts, a flags byte marking a rematerializable instruction and an integer
+frequency, and then one (string ID, dead flag) pair per operand. Strings are defined the first time they are needed,
+so both forms can be written and read in a single streaming pass.
+
+The readers yield one ``Instruction`` at a time and ``ILFile`` exposes a file as an ``instructions`` iterable, so
+``build_graph`` and ``estimate_spill_costs`` can run over a file without holding the whole instruction list.
+"""
+import mmap
+import struct
+from typing import Iterator, Dict, List
+
+from register_allocation import Dec, Use, Instruction, IntermediateLanguage
+
+TEXT_HEADER = '#il 1'
+BINARY_MAGIC = b'\x89ILB\r\n\x1a\n'
+
+_STRING = b'S'
+_INSTRUCTION = b'I'
+_REMAT_FIELD = 'remat'
+_REMAT_FLAG = 1
+_INTEGER_FLAG = 2
+_LENGTH = struct.Struct('<I')
+_HEADER = struct.Struct('<IdHHB')
+_OPERAND = struct.Struct('<IB')
+
+_ESCAPES = {'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', ' ': '\\s'}
+_UNESCAPES = {'\\': '\\', 't': '\t', 'n': '\n', 'r': '\r', 's': ' '}
+
+
+def escape(text: str) -> str:
+    """
+    Escapes ``text`` into a single field of a line oriented format, with no tab, newline or space.
+    """
+    escaped = ''.join(_ESCAPES.get(char, char) for char in text)
+    # A leading ! would mark a dead operand and a leading # a comment line
+    if escaped.startswith(('!', '#')):
+        escaped = '\\' + escaped
+    return escaped
+
+
+def unescape(text: str) -> str:
+    """
+    Reverses ``escape``.
+    """
+    if '\\' not in text:
+        return text
+
+    chars = []
+    escaped = False
+    for char in text:
+        if escaped:
+            chars.append(_UNESCAPES.get(char, char))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        else:
+            chars.append(char)
+    return ''.join(chars)
+
+
+def _format_operands(operands) -> str:
+    return ' '.join(('!' if operand.dead else '') + escape(operand.reg) for operand in operands)
+
+
+def _parse_operands(field: str, cls) -> List:
+    operands = []
+    for token in field.split(' '):
+        if token == '':
+            continue
+        if token.startswith('!'):
+            operands.append(cls(unescape(token[1:]), True))
+        else:
+            operands.append(cls(unescape(token), False))
+    return operands
+
+
+def _parse_frequency(field: str):
+    try:
+        return int(field)
+    except ValueError:
+        return float(field)
+
+
+def write_text(il, path: str) -> None:
+    """
+    Writes the instructions of ``il`` in the text form.
+    """
+    with open(path, 'w', encoding='utf-8', newline='\n') as file:
+        file.write(TEXT_HEADER + '\n')
+        for instruction in il.instructions:
+            fields = [
+                escape(instruction.opcode),
+                repr(instruction.frequency),
+                _format_operands(instruction.dec),
+                _format_operands(instruction.use)
+            ]
+            if instruction.rematerializable:
+                fields.append(_REMAT_FIELD)
+            file.write('\t'.join(fields) + '\n')
+
+
+def read_text(path: str) -> Iterator[Instruction]:
+    with open(path, 'r', encoding='utf-8', newline='\n') as file:
+        header = False
+        for line_number, line in enumerate(file, 1):
+            line = line.rstrip('\n')
+            if line == '':
+                continue
+            if not header:
+                if line != TEXT_HEADER:
+                    raise ValueError('{}: not a text IL file'.format(path))
+                header = True
+                continue
+            if line.startswith('#'):
+                continue
+
+            fields = line.split('\t')
+            if len(fields) not in (4, 5):
+                raise ValueError('{}:{}: expected 4 or 5 tab separated fields, found {}'.format(
+                    path, line_number, len(fields)))
+            if len(fields) == 5 and fields[4] != _REMAT_FIELD:
+                raise ValueError('{}:{}: unknown instruction flag {!r}'.format(path, line_number, fields[4]))
+
+            opcode, frequency, decs, uses = fields[:4]
+            yield Instruction(
+                unescape(opcode),
+                _parse_operands(decs, Dec),
+                _parse_operands(uses, Use),
+                _parse_frequency(frequency),
+                len(fields) == 5
+            )
+
+
+def write_binary(il, path: str) -> None:
+    """
+    Writes the instructions of ``il`` in the binary form.
+    """
+    ids: Dict[str, int] = {}
+
+    with open(path, 'wb') as file:
+        def string_id(text: str) -> int:
+            text_id = ids.get(text)
+            if text_id is None:
+                text_id = len(ids)
+                ids[text] = text_id
+                data = text.encode('utf-8')
+                file.write(_STRING + _LENGTH.pack(len(data)) + data)
+            return text_id
+
+        file.write(BINARY_MAGIC)
+        for instruction in il.instructions:
+            operands = [(string_id(dec.reg), dec.dead) for dec in instruction.dec]
+            operands += [(string_id(use.reg), use.dead) for use in instruction.use]
+
+            flags = _REMAT_FLAG if instruction.rematerializable else 0
+            if isinstance(instruction.frequency, int):
+                flags |= _INTEGER_FLAG
+            record = [_INSTRUCTION, _HEADER.pack(string_id(instruction.opcode), instruction.frequency,
+                                                 len(instruction.dec), len(instruction.use), flags)]
+            record += [_OPERAND.pack(reg_id, dead) for reg_id, dead in operands]
+            file.write(b''.join(record))
+
+
+def read_binary(path: str) -> Iterator[Instruction]:
+    """
+    Reads the binary form through a read-only memory map, one instruction at a time.
+    """
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(BINARY_MAGIC)] != BINARY_MAGIC:
+                raise ValueError('{}: not a binary IL file'.format(path))
+
+            strings = []
+            offset = len(BINARY_MAGIC)
+            end = len(data)
+
+            while offset < end:
+                tag = data[offset:offset + 1]
+                offset += 1
+
+                if tag == _STRING:
+                    length, = _LENGTH.unpack_from(data, offset)
+                    offset += _LENGTH.size
+                    strings.append(data[offset:offset + length].decode('utf-8'))
+                    offset += length
+                elif tag == _INSTRUCTION:
+                    opcode, frequency, dec_count, use_count, flags = _HEADER.unpack_from(data, offset)
+                    offset += _HEADER.size
+
+                    decs = []
+                    for _ in range(dec_count):
+                        reg_id, dead = _OPERAND.unpack_from(data, offset)
+                        offset += _OPERAND.size
+                        decs.append(Dec(strings[reg_id], bool(dead)))
+
+                    uses = []
+                    for _ in range(use_count):
+                        reg_id, dead = _OPERAND.unpack_from(data, offset)
+                        offset += _OPERAND.size
+                        uses.append(Use(strings[reg_id], bool(dead)))
+
+                    if flags & _INTEGER_FLAG:
+                        frequency = int(frequency)
+                    yield Instruction(strings[opcode], decs, uses, frequency, bool(flags & _REMAT_FLAG))
+                else:
+                    raise ValueError('{}: unknown record {!r} at offset {}'.format(path, tag, offset - 1))
+
+
+def read_instructions(path: str) -> Iterator[Instruction]:
+    """
+    Streams the instructions of an IL file in either form, detected from the first bytes of the file.
+    """
+    with open(path, 'rb') as file:
+        binary = file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+    if binary:
+        return read_binary(path)
+    return read_text(path)
+
+
+def load(path: str) -> IntermediateLanguage:
+    """
+    Reads a whole IL file into memory.
+    """
+    return IntermediateLanguage(list(read_instructions(path)))
+
+
+class ILFile:
+    """
+    An IL file used in place of an ``IntermediateLanguage``. Every access to ``instructions`` re-reads the file, so
+    read-only passes stream over it instead of keeping the instruction list in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @property
+    def instructions(self) -> Iterator[Instruction]:
+        return read_instructions(self.path)
+
+    def registers(self):
+        reg = set()
+
+        for instruction in self.instructions:
+            for dec in instruction.dec:
+                reg.add(dec.reg)
+            for use in instruction.use:
+                reg.add(use.reg)
+
+        return reg
@@ -0,0 +1,278 @@
+"""
+Builds and colors interference graphs too large to hold in memory.
+
+``build_graph_out_of_core`` replays liveness with the rules of ``add_interference``, but instead of adding edges to a
+``Graph`` it packs every edge, in both directions, into a buffer of 64 bit integers holding the two node numbers.
+Whenever the buffer fills its share of the memory budget it is sorted, deduplicated and written to a temporary run
+file. The runs are then merged into a ``graph_format`` CSR file one row at a time. ``color_csr`` and
+``decide_spills_csr`` run simplify, select and spill selection directly against the memory mapped file, keeping one
+array entry per node instead of an adjacency set.
+
+The budget bounds the memory that grows with the number of edges. What grows with the number of registers (their
+names, the CSR offsets, the degree and cost arrays) is kept regardless.
+
+The IL is read twice, once for its register names and once for its edges, so an ``il_format.ILFile`` can be
+allocated without loading its instruction list.
+"""
+import os
+import sys
+import tempfile
+from array import array
+from bisect import bisect_right
+from typing import Collection, Dict, Iterator, List, Optional, Set, Tuple
+
+from graph_format import CSRGraph, _little_endian, _write_csr
+from register_allocation import estimate_spill_costs
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Sorting and deduplicating the buffer goes through a list and a dict of Python ints, about this many bytes per edge
+_BYTES_PER_BUFFERED_EDGE = 128
+
+_MIN_BLOCK = 1024
+
+
+def build_graph_out_of_core(il,
+                            path: str,
+                            memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                            directory: Optional[str] = None) -> CSRGraph:
+    """
+    Builds the interference graph of ``il`` into a CSR file without holding its edges in memory.
+
+    Liveness on entry to a block comes from the non-dead decs of its ``'bb'`` instruction, see ``annotate_live_in``.
+
+    :param il: Anything with a re-readable ``instructions`` iterable and ``registers``, such as an
+        ``IntermediateLanguage`` or an ``il_format.ILFile``
+    :param path: The CSR file to write
+    :param memory_budget: The bytes the edge buffer and the merge may use
+    :param directory: Where the temporary run files go, the system default when omitted
+    :return: The graph, memory mapped from ``path``
+    """
+    labels = sorted(il.registers())
+    ids = {label: node_id for node_id, label in enumerate(labels)}
+
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        runs = _write_runs(il, ids, scratch, max(1, memory_budget // _BYTES_PER_BUFFERED_EDGE))
+        # Every run has a block in memory and a merge step can sort all of them at once
+        block = max(_MIN_BLOCK, memory_budget // (_BYTES_PER_BUFFERED_EDGE * max(1, len(runs))))
+        _write_csr(path, labels, _merged_rows(runs, len(labels), block), None, None)
+
+    return CSRGraph(path)
+
+
+def _write_runs(il, ids: Dict[str, int], directory: str, capacity: int) -> List[str]:
+    runs = []
+    buffer = array('Q')
+
+    def flush() -> None:
+        run = os.path.join(directory, 'run{}'.format(len(runs)))
+        with open(run, 'wb') as file:
+            # Sorting first lets dict.fromkeys drop the duplicates while keeping the order
+            file.write(_little_endian(array('Q', dict.fromkeys(sorted(buffer)))))
+        runs.append(run)
+        del buffer[:]
+
+    liveness = None
+    for instruction in il.instructions:
+        if instruction.opcode == 'bb':
+            liveness = {}
+        else:
+            for use in instruction.use:
+                if use.dead:
+                    reg = ids[use.reg]
+                    liveness[reg] -= 1
+                    if liveness[reg] == 0:
+                        del liveness[reg]
+
+            for dec in instruction.dec:
+                x = ids[dec.reg]
+                high = x << 32
+                buffer.extend([high | y for y in liveness if y != x])
+                buffer.extend([y << 32 | x for y in liveness if y != x])
+                if len(buffer) >= capacity:
+                    flush()
+
+        for dec in instruction.dec:
+            if not dec.dead:
+                reg = ids[dec.reg]
+                liveness[reg] = liveness.get(reg, 0) + 1
+
+    if buffer:
+        flush()
+    return runs
+
+
+def _read_run(path: str, block: int) -> Iterator[array]:
+    with open(path, 'rb') as file:
+        while True:
+            values = array('Q')
+            try:
+                values.fromfile(file, block)
+            except EOFError:
+                # The items read before the end of the file are kept
+                pass
+            if not values:
+                return
+            if sys.byteorder == 'big':
+                values.byteswap()
+            yield values
+
+
+def _merged_blocks(runs: List[str], block: int) -> Iterator[array]:
+    """
+    Merges sorted runs a block at a time: everything up to the smallest last edge of the blocks in memory is sorted
+    together and yielded, since no edge still on disk can come before it.
+
+    :return: Sorted, deduplicated blocks of edges in increasing order
+    """
+    readers = [_read_run(run, block) for run in runs]
+    buffers = [array('Q') for _ in runs]
+
+    while True:
+        for index, reader in enumerate(readers):
+            if reader is not None and not buffers[index]:
+                buffers[index] = next(reader, array('Q'))
+                if not buffers[index]:
+                    readers[index] = None
+        loaded = [buffer for buffer in buffers if buffer]
+        if not loaded:
+            return
+
+        bound = min(buffer[-1] for buffer in loaded)
+        merged = []
+        for index, buffer in enumerate(buffers):
+            cut = bisect_right(buffer, bound)
+            merged.extend(buffer[:cut])
+            buffers[index] = buffer[cut:]
+        # The slices are sorted already, and runs are deduplicated on their own but can share edges
+        yield array('Q', dict.fromkeys(sorted(merged)))
+
+
+def _merged_rows(runs: List[str], node_count: int, block: int) -> Iterator[array]:
+    """
+    Merges the sorted runs and yields the sorted neighbor numbers of every node in node order.
+    """
+    node = 0
+    row = array('I')
+
+    for edges in _merged_blocks(runs, block):
+        # Split the packed edges into their halves without a Python loop per edge
+        words = array('I', edges.tobytes())
+        if sys.byteorder == 'little':
+            targets, sources = words[0::2], words[1::2]
+        else:
+            sources, targets = words[0::2], words[1::2]
+
+        start = 0
+        while start < len(sources):
+            x = sources[start]
+            end = bisect_right(sources, x, start)
+            while node < x:
+                yield row
+                row = array('I')
+                node += 1
+            row.extend(targets[start:end])
+            start = end
+
+    while node < node_count:
+        yield row
+        row = array('I')
+        node += 1
+
+
+def _simplify(csr: CSRGraph, k: int, cheapest: Optional[Iterator[int]]) -> Tuple[array, array, int]:
+    """
+    Removes nodes of fewer than ``k`` remaining neighbors, or the next node of ``cheapest`` when there are none.
+
+    :return: The removed nodes in order, the nodes taken from ``cheapest`` and the number of nodes left
+    """
+    node_count = len(csr)
+    degree = array('q', (len(csr.neighbor_ids(node)) for node in range(node_count)))
+    removed = bytearray(node_count)
+    low = array('q', (node for node in range(node_count) if degree[node] < k))
+    stack = array('q')
+    spilled = array('q')
+    remaining = node_count
+
+    while remaining:
+        if low:
+            # A node is pushed once, when its degree drops below k, and only low nodes are removed meanwhile
+            node = low.pop()
+        elif cheapest is None:
+            break
+        else:
+            node = next(node for node in cheapest if not removed[node])
+            spilled.append(node)
+
+        removed[node] = 1
+        remaining -= 1
+        stack.append(node)
+        for neighbor in csr.neighbor_ids(node):
+            if not removed[neighbor]:
+                degree[neighbor] -= 1
+                if degree[neighbor] == k - 1:
+                    low.append(neighbor)
+
+    return stack, spilled, remaining
+
+
+def color_csr(csr: CSRGraph, colors: List[str]) -> Optional[Dict[str, str]]:
+    """
+    Colors a memory mapped graph with simplify/select as ``color_graph`` does. Each node gets the first color its
+    neighbors do not have, so the result is repeatable.
+
+    :return: The coloring, or None if simplify gets stuck before every node is removed
+    """
+    stack, _, remaining = _simplify(csr, len(colors), None)
+    if remaining:
+        return None
+
+    node_colors = array('i', [-1]) * len(csr)
+    while stack:
+        node = stack.pop()
+        neighbor_colors = {node_colors[neighbor] for neighbor in csr.neighbor_ids(node)}
+        node_colors[node] = next(color for color in range(len(colors)) if color not in neighbor_colors)
+
+    return {csr.label(node): colors[color] for node, color in enumerate(node_colors)}
+
+
+def decide_spills_csr(csr: CSRGraph, k: int, cost: Dict[str, float]) -> Set[str]:
+    """
+    Chooses the registers to spill from a memory mapped graph as ``decide_spills`` does: when no node has fewer
+    than ``k`` remaining neighbors, the cheapest remaining node is spilled.
+
+    :param cost: Estimated cost of spilling each register
+    :return: The set of spilled registers
+    """
+    weights = array('d', (cost.get(csr.label(node), 0) for node in range(len(csr))))
+    # Ties break by node number, which follows the sorted register names
+    order = sorted(range(len(csr)), key=weights.__getitem__)
+
+    _, spilled, _ = _simplify(csr, k, iter(order))
+    return {csr.label(node) for node in spilled}
+
+
+def allocate_out_of_core(il,
+                         colors: List[str],
+                         memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                         directory: Optional[str] = None,
+                         spilled_before: Collection[str] = ()) -> Tuple[Optional[Dict[str, str]], Set[str]]:
+    """
+    One round of allocation with the interference graph kept on disk.
+
+    The IL is not changed. When registers must be spilled, insert spill code for them, with ``insert_spill_code`` or
+    a streaming equivalent, and call this again with every register spilled so far in ``spilled_before``.
+
+    :param spilled_before: Registers created by earlier spill code, which are only spilled when nothing else is left
+    :return: The coloring, or None if registers must be spilled, and the registers to spill
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        with build_graph_out_of_core(il, os.path.join(scratch, 'graph.csr'), memory_budget, scratch) as csr:
+            coloring = color_csr(csr, colors)
+            if coloring is not None:
+                return coloring, set()
+
+            cost = estimate_spill_costs(il)
+            for reg in spilled_before:
+                cost[reg] = float('inf')
+            return None, decide_spills_csr(csr, len(colors), cost)
@@ -1,29 +1,44 @@
-import copy
-from random import choice
-from typing import List, Set, Collection, Dict, Optional, Tuple
-
-import matplotlib.pyplot as plt
-import networkx as nx
+import heapq
+import os
+import time
+from array import array
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from random import Random
+from typing import List, Set, Collection, Dict, Optional, Tuple, Callable
 
 
 class Dec:
+    __slots__ = ('reg', 'dead')
+
     def __init__(self, reg: str, dead: bool):
         self.reg = reg
         self.dead = dead
 
 
 class Use:
+    __slots__ = ('reg', 'dead')
+
     def __init__(self, reg: str, dead: bool):
         self.reg = reg
         self.dead = dead
 
 
 class Instruction:
-    def __init__(self, opcode: str, dec: List[Dec], use: List[Use], frequency=1):
+    """
+    A rematerializable instruction computes its decs from its uses alone, without side effects, so the allocator may
+    execute a copy of it again instead of reloading a spilled result from memory.
+    """
+
+    __slots__ = ('opcode', 'dec', 'use', 'frequency', 'rematerializable')
+
+    def __init__(self, opcode: str, dec: List[Dec], use: List[Use], frequency=1, rematerializable: bool = False):
         self.opcode = opcode
         self.dec = dec
         self.use = use
         self.frequency = frequency
+        self.rematerializable = rematerializable
 
 
 class IntermediateLanguage:
@@ -41,7 +56,9 @@ class IntermediateLanguage:
         self.instructions = [Instruction(
             instruction.opcode,
             [Dec(f.get(dec.reg, dec.reg), dec.dead) for dec in instruction.dec],
-            [Use(f.get(use.reg, use.reg), use.dead) for use in instruction.use]
+            [Use(f.get(use.reg, use.reg), use.dead) for use in instruction.use],
+            instruction.frequency,
+            instruction.rematerializable
         ) for instruction in self.instructions]
 
     def registers(self) -> Set[str]:
@@ -56,130 +73,1269 @@ class IntermediateLanguage:
         return reg
 
 
+class CompactIntermediateLanguage:
+    """
+    A struct-of-arrays form of the intermediate language.
+
+    Register names and opcodes are interned to integer IDs. Opcodes, frequencies and rematerializable flags are
+    stored one entry per instruction, and the dec and use operands of all instructions are stored back to back in
+    flat arrays, indexed by per-instruction offsets: the decs of instruction ``i`` are
+    ``dec_registers[dec_offsets[i]:dec_offsets[i + 1]]``.
+
+    The ``instructions`` property yields ``Instruction`` objects one at a time, so the allocator passes that iterate
+    an ``IntermediateLanguage`` also accept this form without materializing the whole object list. ``build_graph``
+    reads the arrays directly instead, since building every instruction again costs as much as the replay itself.
+    """
+
+    def __init__(self):
+        self.register_names = []
+        self.register_ids = {}
+        self.opcode_names = []
+        self.opcode_ids = {}
+
+        self.opcodes = array('i')
+        self.frequencies = array('d')
+        self.rematerializable = array('b')
+        self.dec_offsets = array('q', [0])
+        self.dec_registers = array('i')
+        self.dec_dead = array('b')
+        self.use_offsets = array('q', [0])
+        self.use_registers = array('i')
+        self.use_dead = array('b')
+
+    @classmethod
+    def from_il(cls, il: IntermediateLanguage) -> 'CompactIntermediateLanguage':
+        compact = cls()
+        for instruction in il.instructions:
+            compact.append(instruction)
+        return compact
+
+    def to_il(self) -> IntermediateLanguage:
+        return IntermediateLanguage(list(self.instructions))
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def register_id(self, reg: str) -> int:
+        reg_id = self.register_ids.get(reg)
+        if reg_id is None:
+            reg_id = len(self.register_names)
+            self.register_ids[reg] = reg_id
+            self.register_names.append(reg)
+        return reg_id
+
+    def append(self, instruction: Instruction) -> None:
+        opcode_id = self.opcode_ids.get(instruction.opcode)
+        if opcode_id is None:
+            opcode_id = len(self.opcode_names)
+            self.opcode_ids[instruction.opcode] = opcode_id
+            self.opcode_names.append(instruction.opcode)
+
+        self.opcodes.append(opcode_id)
+        self.frequencies.append(instruction.frequency)
+        self.rematerializable.append(instruction.rematerializable)
+
+        for dec in instruction.dec:
+            self.dec_registers.append(self.register_id(dec.reg))
+            self.dec_dead.append(dec.dead)
+        self.dec_offsets.append(len(self.dec_registers))
+
+        for use in instruction.use:
+            self.use_registers.append(self.register_id(use.reg))
+            self.use_dead.append(use.dead)
+        self.use_offsets.append(len(self.use_registers))
+
+    def instruction(self, index: int) -> Instruction:
+        names = self.register_names
+        dec_range = range(self.dec_offsets[index], self.dec_offsets[index + 1])
+        use_range = range(self.use_offsets[index], self.use_offsets[index + 1])
+
+        return Instruction(
+            self.opcode_names[self.opcodes[index]],
+            [Dec(names[self.dec_registers[i]], bool(self.dec_dead[i])) for i in dec_range],
+            [Use(names[self.use_registers[i]], bool(self.use_dead[i])) for i in use_range],
+            self.frequencies[index],
+            bool(self.rematerializable[index])
+        )
+
+    @property
+    def instructions(self):
+        return (self.instruction(index) for index in range(len(self.opcodes)))
+
+    def registers(self) -> Set[str]:
+        names = self.register_names
+        return {names[reg_id] for reg_id in set(self.dec_registers) | set(self.use_registers)}
+
+
+def _iter_bits(mask: int):
+    """
+    Yields the index of every set bit in ``mask``, lowest first, by clearing the lowest set bit each step.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class SetAdjacency:
+    """
+    Hash-set adjacency. Each node maps to the set of its neighbors, so edge tests and insertions are O(1) and removing
+    a node is O(degree).
+
+    Neighbor sets are dicts with ``None`` values so iteration order follows insertion order and is repeatable.
+    """
+
+    bitset_rows = False
+
+    def __init__(self):
+        self._adjacency = {}
+
+    def copy(self):
+        new_adjacency = self.__class__()
+        new_adjacency._adjacency = {node: dict(neighbors) for node, neighbors in self._adjacency.items()}
+        return new_adjacency
+
+    def add_edges(self, x, ys) -> int:
+        x_neighbors = self._adjacency.setdefault(x, {})
+        count = len(x_neighbors)
+        x_neighbors.update(dict.fromkeys(ys))
+        x_neighbors.pop(x, None)
+
+        adjacency = self._adjacency
+        for y in ys:
+            if y != x:
+                if y in adjacency:
+                    adjacency[y][x] = None
+                else:
+                    adjacency[y] = {x: None}
+        return len(x_neighbors) - count
+
+    def add_row(self, x, ys) -> None:
+        x_neighbors = self._adjacency.get(x)
+        if x_neighbors is None:
+            self._adjacency[x] = dict.fromkeys(ys)
+        else:
+            x_neighbors.update(dict.fromkeys(ys))
+
+    def add_edge(self, x, y) -> bool:
+        x_neighbors = self._adjacency.setdefault(x, {})
+        if y in x_neighbors:
+            return False
+
+        x_neighbors[y] = None
+        self._adjacency.setdefault(y, {})[x] = None
+        return True
+
+    def contains_edge(self, x, y):
+        return y in self._adjacency.get(x, ())
+
+    def remove_node(self, node):
+        for neighbor in self._adjacency.pop(node, ()):
+            self._adjacency[neighbor].pop(node, None)
+
+    def rename_node(self, from_label, to_label):
+        if from_label == to_label:
+            return
+
+        from_neighbors = self._adjacency.pop(from_label, None)
+        if from_neighbors is None:
+            return
+
+        to_neighbors = self._adjacency.setdefault(to_label, {})
+        for neighbor in from_neighbors:
+            neighbor_neighbors = self._adjacency[neighbor]
+            neighbor_neighbors.pop(from_label, None)
+            if neighbor != to_label:
+                neighbor_neighbors[to_label] = None
+                to_neighbors[neighbor] = None
+
+    def neighbors(self, x):
+        return self._adjacency.get(x, {}).keys()
+
+    def degree(self, x):
+        return len(self._adjacency.get(x, ()))
+
+    def nodes(self):
+        return self._adjacency.keys()
+
+
+class BitMatrixAdjacency:
+    """
+    Dense bit-matrix adjacency. Node labels are interned to integer IDs and every row of the matrix is a Python int
+    used as a bitset, so an edge test is a single shift and mask. Removing a node clears its bit in the rows of its
+    neighbors only, which is O(degree) row updates.
+
+    IDs of removed nodes are recycled so the matrix stays as small as the largest live node count.
+    """
+
+    bitset_rows = True
+
+    def __init__(self):
+        self._ids = {}
+        self._labels = []
+        self._rows = []
+        self._free = []
+
+    def copy(self):
+        new_adjacency = self.__class__()
+        new_adjacency._ids = dict(self._ids)
+        new_adjacency._labels = list(self._labels)
+        new_adjacency._rows = list(self._rows)
+        new_adjacency._free = list(self._free)
+        return new_adjacency
+
+    def intern(self, label) -> int:
+        node_id = self._ids.get(label)
+        if node_id is None:
+            if self._free:
+                node_id = self._free.pop()
+                self._labels[node_id] = label
+                self._rows[node_id] = 0
+            else:
+                node_id = len(self._labels)
+                self._labels.append(label)
+                self._rows.append(0)
+            self._ids[label] = node_id
+        return node_id
+
+    def _release(self, node_id: int) -> None:
+        del self._ids[self._labels[node_id]]
+        self._labels[node_id] = None
+        self._rows[node_id] = 0
+        self._free.append(node_id)
+
+    def add_edge(self, x, y) -> bool:
+        x_id = self.intern(x)
+        y_id = self.intern(y)
+        if (self._rows[x_id] >> y_id) & 1:
+            return False
+
+        self._rows[x_id] |= 1 << y_id
+        self._rows[y_id] |= 1 << x_id
+        return True
+
+    def add_edges(self, x, ys, mask: Optional[int] = None) -> int:
+        x_id = self.intern(x)
+        if mask is None:
+            mask = 0
+            for y in ys:
+                mask |= 1 << self.intern(y)
+
+        added = mask & ~self._rows[x_id] & ~(1 << x_id)
+        if not added:
+            return 0
+
+        self._rows[x_id] |= added
+        x_bit = 1 << x_id
+        for y_id in _iter_bits(added):
+            self._rows[y_id] |= x_bit
+        return added.bit_count()
+
+    def add_row(self, x, ys) -> None:
+        mask = 0
+        for y in ys:
+            mask |= 1 << self.intern(y)
+        x_id = self.intern(x)
+        self._rows[x_id] |= mask
+
+    def contains_edge(self, x, y):
+        x_id = self._ids.get(x)
+        y_id = self._ids.get(y)
+        if x_id is None or y_id is None:
+            return False
+        return (self._rows[x_id] >> y_id) & 1 == 1
+
+    def remove_node(self, node):
+        node_id = self._ids.get(node)
+        if node_id is None:
+            return
+
+        clear = ~(1 << node_id)
+        for neighbor_id in _iter_bits(self._rows[node_id]):
+            self._rows[neighbor_id] &= clear
+        self._release(node_id)
+
+    def rename_node(self, from_label, to_label):
+        from_id = self._ids.get(from_label)
+        if from_id is None or from_label == to_label:
+            return
+
+        to_id = self.intern(to_label)
+        from_row = self._rows[from_id] & ~(1 << to_id)
+        clear = ~(1 << from_id)
+        to_bit = 1 << to_id
+        for neighbor_id in _iter_bits(self._rows[from_id]):
+            self._rows[neighbor_id] &= clear
+            if neighbor_id != to_id:
+                self._rows[neighbor_id] |= to_bit
+        self._rows[to_id] |= from_row
+        self._release(from_id)
+
+    def neighbors(self, x):
+        x_id = self._ids.get(x)
+        if x_id is None:
+            return []
+        return [self._labels[neighbor_id] for neighbor_id in _iter_bits(self._rows[x_id])]
+
+    def degree(self, x):
+        x_id = self._ids.get(x)
+        if x_id is None:
+            return 0
+        return self._rows[x_id].bit_count()
+
+    def nodes(self):
+        return self._ids.keys()
+
+
 class Graph:
     """
     The register interference graph.
+
+    The adjacency storage is pluggable: ``SetAdjacency`` (the default) is the faster backend on the benchmark programs
+    while ``BitMatrixAdjacency`` stores a dense graph in far less memory, one bit per pair of nodes.
     """
 
-    def __init__(self):
-        self._adjacency_list = {}
+    def __init__(self, backend=SetAdjacency):
+        self._adjacency = backend()
 
     def __copy__(self):
         cls = self.__class__
         new_graph = self.__new__(cls)
-        new_graph._adjacency_list = copy.deepcopy(self._adjacency_list)
+        new_graph._adjacency = self._adjacency.copy()
         return new_graph
 
-    def add_edge(self, x, y):
+    def add_edge(self, x, y) -> bool:
         """
         Add an edge to the graph.
 
         The interference graph is undirected so add_edge('a', 'b') and add_edge('b', 'a') have the same effect.
+
+        :return: True if the edge was not already in the graph
+        """
+        return self._adjacency.add_edge(x, y)
+
+    @property
+    def bitset_rows(self) -> bool:
+        """
+        True when the adjacency stores rows as bitsets over the IDs returned by ``intern``.
+        """
+        return self._adjacency.bitset_rows
+
+    def intern(self, label) -> int:
+        return self._adjacency.intern(label)
+
+    def add_edges(self, x, ys, mask: Optional[int] = None) -> int:
         """
-        # Add y to x
-        x_list = self._adjacency_list.get(x, [])
-        if y not in x_list:
-            x_list.append(y)
-        self._adjacency_list[x] = x_list
-
-        # Add x to y
-        y_list = self._adjacency_list.get(y, [])
-        if x not in y_list:
-            y_list.append(x)
-        self._adjacency_list[y] = y_list
+        Adds an edge from ``x`` to every node in ``ys`` as one bulk update of the adjacency of ``x``.
+
+        :param mask: Optionally the same nodes as a bitset over interned IDs, only given to bitset backends
+        :return: The number of edges that were not already in the graph
+        """
+        if mask is None:
+            return self._adjacency.add_edges(x, ys)
+        return self._adjacency.add_edges(x, ys, mask)
+
+    def add_row(self, x, ys) -> None:
+        """
+        Adds ``ys`` to the neighbors of ``x`` without adding ``x`` to theirs, for merging adjacency that already holds
+        both directions of every edge. A graph only stays undirected if the rows of ``ys`` are merged as well.
+        """
+        self._adjacency.add_row(x, ys)
 
     def contains_edge(self, x, y):
-        return y in self._adjacency_list.get(x, [])
+        return self._adjacency.contains_edge(x, y)
 
     def remove_node(self, node):
-        if node in self._adjacency_list:
-            self._adjacency_list.pop(node)
-        for key in self._adjacency_list.keys():
-            if node in self._adjacency_list.get(key):
-                self._adjacency_list.get(key).remove(node)
+        self._adjacency.remove_node(node)
 
     def rename_node(self, from_label, to_label):
-        from_list = self._adjacency_list.pop(from_label, [])
-        to_list = self._adjacency_list.get(to_label, [])
-        self._adjacency_list[to_label] = list(set(from_list + to_list))
-
-        for key in self._adjacency_list.keys():
-            self._adjacency_list[key] = list(set(
-                [to_label if value == from_label else value for value in self._adjacency_list[key]]
-            ))
+        self._adjacency.rename_node(from_label, to_label)
 
     def neighbors(self, x):
-        return self._adjacency_list.get(x, [])
+        return self._adjacency.neighbors(x)
+
+    def degree(self, x) -> int:
+        return self._adjacency.degree(x)
+
+    def nodes(self):
+        return self._adjacency.nodes()
+
+    def edge_count(self) -> int:
+        return sum(self.degree(node) for node in self.nodes()) // 2
+
+    def edges(self):
+        """
+        Yields every edge once as an ``(x, y)`` tuple.
+        """
+        seen = set()
+        for x in self.nodes():
+            for y in self.neighbors(x):
+                if y not in seen:
+                    yield x, y
+            seen.add(x)
 
     def plot(self, coloring, title):
+        # Imported here so allocating without plotting never pays for matplotlib and networkx
+        import matplotlib.pyplot as plt
+        import networkx as nx
+
         G = nx.Graph()
 
         # Sorting to get repeatable graphs
-        nodes = sorted(self._adjacency_list.keys())
+        nodes = sorted(self.nodes())
         ordered_coloring = [coloring.get(node, 'grey') for node in nodes]
         G.add_nodes_from(nodes)
-
-        for key in self._adjacency_list.keys():
-            for value in self._adjacency_list[key]:
-                G.add_edge(key, value)
+        G.add_edges_from(self.edges())
 
         plt.title(title)
         nx.draw(G, pos=nx.circular_layout(G), node_color=ordered_coloring, with_labels=True, font_weight='bold')
         plt.show()
 
 
-def run(il: IntermediateLanguage, colors: List[str]) -> Tuple[Optional[Graph], Optional[Dict[str, str]]]:
-    graph, coloring = color_il(il, colors)
-    if coloring is None:
-        graph.plot({}, 'Initial')
-        cost = estimate_spill_costs(il)
-        spilled = decide_spills(il, graph, colors, cost)
-        insert_spill_code(il, spilled)
-        graph, coloring = color_il(il, colors)
-        graph.plot({}, 'After Spilling')
-        graph.plot(coloring, 'Colored')
+class GraphOverlay:
+    """
+    A view of a graph with nodes removed, for passes that remove nodes on trial without copying or changing the
+    underlying graph.
+
+    Removed nodes are kept in a set and recorded in an undo log, and the degrees of the nodes next to them are kept
+    in a map of adjusted degrees; every other node still has its degree in the graph. Removing a node costs
+    O(degree), and ``rollback`` restores the view to a ``checkpoint`` by replaying the log backwards, at the same cost
+    as the removals it undoes.
+
+    The underlying graph must not change while the overlay is in use.
+
+    :param nodes: Optional nodes whose degrees are looked up once up front instead of on first use
+    """
+
+    def __init__(self, graph: Graph, nodes: Collection = ()):
+        self._graph = graph
+        self._removed = set()
+        self._degree = {node: graph.degree(node) for node in nodes}
+        self._log = []
+
+    def __contains__(self, node):
+        return node not in self._removed and node in self._graph.nodes()
+
+    def remove_node(self, node) -> Dict:
+        """
+        :return: The remaining neighbors of ``node``, whose degree dropped by one, mapped to their new degree
+        """
+        if node in self._removed:
+            return {}
+        self._removed.add(node)
+        self._log.append(node)
+
+        removed = self._removed
+        degree = self._degree
+        neighbors = {}
+        for neighbor in self._graph.neighbors(node):
+            if neighbor not in removed:
+                neighbor_degree = degree.get(neighbor)
+                if neighbor_degree is None:
+                    neighbor_degree = self._graph.degree(neighbor)
+                degree[neighbor] = neighbors[neighbor] = neighbor_degree - 1
+        return neighbors
+
+    def degree(self, x) -> int:
+        if x in self._removed:
+            return 0
+        degree = self._degree.get(x)
+        return self._graph.degree(x) if degree is None else degree
+
+    def neighbors(self, x) -> List:
+        if x in self._removed:
+            return []
+        removed = self._removed
+        return [neighbor for neighbor in self._graph.neighbors(x) if neighbor not in removed]
+
+    def contains_edge(self, x, y) -> bool:
+        return x not in self._removed and y not in self._removed and self._graph.contains_edge(x, y)
+
+    def nodes(self) -> List:
+        removed = self._removed
+        return [node for node in self._graph.nodes() if node not in removed]
+
+    def removed(self) -> List:
+        """
+        :return: The removed nodes in the order they were removed
+        """
+        return list(self._log)
+
+    def checkpoint(self) -> int:
+        return len(self._log)
+
+    def rollback(self, checkpoint: int = 0) -> None:
+        """
+        Restores every node removed since ``checkpoint``, most recent first.
+        """
+        removed = self._removed
+        degree = self._degree
+        while len(self._log) > checkpoint:
+            node = self._log.pop()
+            removed.discard(node)
+            for neighbor in self._graph.neighbors(node):
+                if neighbor not in removed:
+                    degree[neighbor] += 1
+
+
+Visualizer = Callable[[Graph, Dict[str, str], str], None]
+
+# Chaitin notes one round of spill code is usually enough, this bounds the rare cases that need more
+MAX_SPILL_ROUNDS = 8
+
+# Recomputing a value is assumed to cost half as much as reloading it
+REMAT_COST = 0.5
+
+# Functions with at least this many instructions are allocated by linear scan when the allocator is ``'auto'``
+LINEAR_SCAN_THRESHOLD = 2000
+
+ALLOCATORS = ('chaitin', 'irc', 'chordal', 'linear_scan')
+
+# Below this many instructions starting worker processes and pickling the blocks costs more than building serially
+PARALLEL_BUILD_THRESHOLD = 50000
+
+
+class AllocationStats:
+    """
+    Wall time per phase and counters collected by ``allocate``.
+
+    Phase times accumulate across spill rounds. When ``on_phase`` is set it is called with the phase name, the
+    seconds spent in it and this object after every phase.
+
+    ``spill_cost`` is the frequency weighted number of reloads and spills inserted and ``spill_cost_everywhere`` what
+    spilling the same registers around every reference would have cost, so the two differ when live ranges are
+    split. ``memory_ops_removed`` and its weighted ``memory_cost_removed`` count the reloads and spills removed by
+    ``eliminate_redundant_memory_ops``; ``spill_cost`` is measured after they are removed. ``max_clique`` is the
+    register pressure found by the last chordal coloring.
+    """
+
+    def __init__(self, on_phase: Optional[Callable[[str, float, 'AllocationStats'], None]] = None):
+        self.on_phase = on_phase
+        self.phase_seconds: Dict[str, float] = {}
+        self.edges_added = 0
+        self.coalesce_iterations = 0
+        self.simplify_steps = 0
+        self.spill_candidates = 0
+        self.reloads_inserted = 0
+        self.spills_inserted = 0
+        self.remats_inserted = 0
+        self.spill_rounds = 0
+        self.spill_cost_everywhere = 0.0
+        self.spill_cost = 0.0
+        self.memory_ops_removed = 0
+        self.memory_cost_removed = 0.0
+        self.max_clique = 0
+
+    def as_dict(self) -> Dict:
+        return {key: value for key, value in vars(self).items() if key != 'on_phase'}
+
+
+def _phase(stats: Optional[AllocationStats], name: str, f, *args):
+    """
+    Calls ``f(*args)``, timing it when statistics are being collected.
+    """
+    if stats is None:
+        return f(*args)
+
+    start = time.perf_counter()
+    result = f(*args)
+    elapsed = time.perf_counter() - start
+
+    stats.phase_seconds[name] = stats.phase_seconds.get(name, 0.0) + elapsed
+    if stats.on_phase is not None:
+        stats.on_phase(name, elapsed, stats)
+    return result
+
+
+def show_graph(graph: Graph, coloring: Dict[str, str], title: str) -> None:
+    """
+    Visualization hook that draws the graph with matplotlib.
+    """
+    graph.plot(coloring, title)
+
+
+def run(il: IntermediateLanguage,
+        colors: List[str],
+        allocator: str = 'chaitin') -> Tuple[Optional[Graph], Optional[Dict[str, str]]]:
+    """
+    Allocates registers and plots the interference graph at every step.
+
+    :param allocator: The allocator, see ``allocate``
+    """
+    return allocate(il, colors, visualize=show_graph, allocator=allocator)
+
+
+def allocate(il: IntermediateLanguage,
+             colors: List[str],
+             visualize: Optional[Visualizer] = None,
+             stats: Optional[AllocationStats] = None,
+             cfg: Optional['ControlFlowGraph'] = None,
+             optimistic: bool = False,
+             max_spill_rounds: int = MAX_SPILL_ROUNDS,
+             seed: Optional[int] = None,
+             spill_mode: str = 'everywhere',
+             hot_frequency: Optional[float] = None,
+             eliminate_redundant: bool = False,
+             allocator: str = 'chaitin') -> Tuple[Optional[Graph], Optional[Dict[str, str]]]:
+    """
+    Allocates registers without any display side effects unless a visualization hook is given.
+
+    Coloring and spilling alternate until the graph is colored or ``max_spill_rounds`` rounds of spill code have been
+    inserted. Registers created by spill code are never chosen again while other candidates remain.
+
+    :param il: The intermediate language, rewritten in place by coalescing and spilling
+    :param colors: Possible colors
+    :param visualize: Optional hook called with the graph, a coloring and a title at every step
+    :param stats: Optional statistics object filled in with phase times and counters
+    :param cfg: Optional control flow graph. When given, the live-in registers of every block are computed from it
+        and replace the decs of the ``'bb'`` instructions.
+    :param optimistic: Use optimistic coloring, which spills only the nodes that fail to get a color in select
+    :param max_spill_rounds: The maximum number of spill rounds
+    :param seed: Seed for the color choices. With a seed the result only depends on the arguments.
+    :param spill_mode: ``'everywhere'`` to spill with ``insert_spill_code``, ``'split'`` to split live ranges at
+        block boundaries with ``insert_split_code`` or ``'remat'`` to recompute rematerializable registers with
+        ``insert_remat_code``
+    :param hot_frequency: The block frequency from which ``'split'`` keeps a register in a block-local register
+    :param eliminate_redundant: Remove redundant reloads and spills with ``eliminate_redundant_memory_ops`` after
+        every round of spill code. Registers whose ranges this lengthens can be spilled once more, around every
+        reference, and are spilled along with their neighbors that optimistic coloring failed to color.
+    :param allocator: ``'chaitin'`` to coalesce every copy and then color, ``'irc'`` for conservative coalescing
+        interleaved with coloring by ``iterated_register_coalescing``, which is always optimistic, or ``'chordal'``
+        to color SSA-like IL optimally with ``color_graph_chordal``, falling back to ``'chaitin'`` for rounds whose
+        graph is not chordal, ``'linear_scan'`` to allocate over live intervals with ``linear_scan`` without building a
+        graph, falling back to ``'chaitin'`` when it would spill registers created by spill code again, or
+        ``'auto'`` to pick one with ``choose_allocator``
+    :return: The interference graph, None if linear scan colored the IL, and the coloring, or None if no coloring was
+        found
+    """
+    if cfg is not None:
+        live_in, _ = _phase(stats, 'solve_liveness', solve_liveness, il, cfg)
+        annotate_live_in(il, live_in)
+
+    if spill_mode not in ('everywhere', 'split', 'remat'):
+        raise ValueError('unknown spill mode {!r}'.format(spill_mode))
+    if allocator == 'auto':
+        allocator = choose_allocator(il)
+    if allocator not in ALLOCATORS:
+        raise ValueError('unknown allocator {!r}'.format(allocator))
+
+    graph = None
+    spilled_before = set()
+    split_pieces = {}
+    lengthened = set()
+    spill_round = 0
+
+    while True:
+        graph, coloring, spilled = _color_round(il, colors, visualize, graph, stats, optimistic, spilled_before, seed,
+                                                allocator)
+        if spill_round > 0 and visualize is not None and graph is not None:
+            visualize(graph, {}, 'After Spilling')
+        if coloring is not None or spill_round == max_spill_rounds:
+            break
+
+        if visualize is not None and graph is not None:
+            visualize(graph, {}, 'Initial')
+        if spilled is None:
+            cost = _phase(stats, 'estimate_spill_costs', estimate_spill_costs, il)
+            for reg in spilled_before:
+                cost[reg] = float('inf')
+            spilled = _phase(stats, 'decide_spills', decide_spills, il, graph, colors, cost)
+            if stats is not None:
+                stats.spill_candidates += len(spilled)
+        elif graph is not None:
+            # Registers lengthened by elimination can fail again in every later round, one at a time, so those next
+            # to a failed node are spilled with it
+            spilled |= {neighbor for reg in spilled for neighbor in graph.neighbors(reg) if neighbor in lengthened}
+
+        # Spilling a register again cannot shorten the ranges spill code already made minimal
+        spilled -= spilled_before
+        if allocator == 'linear_scan' and (not spilled or spilled & lengthened):
+            # Spilling a register again does not remove the holes between its reloads, on which first fit can fail
+            # where graph coloring succeeds
+            allocator = 'chaitin'
+            continue
+        if not spilled:
+            break
+        if stats is not None:
+            stats.spill_cost_everywhere += spill_everywhere_cost(il, spilled)
+            traffic = memory_traffic(il)
+        if spill_mode == 'split':
+            reloads, spills, pieces = _phase(stats, 'insert_spill_code', insert_split_code, il, spilled,
+                                             hot_frequency, split_pieces)
+            split_pieces.update(pieces)
+        elif spill_mode == 'remat':
+            reloads, spills, remats = _phase(stats, 'insert_spill_code', insert_remat_code, il, spilled)
+            pieces = {}
+            if stats is not None:
+                stats.remats_inserted += remats
+        else:
+            reloads, spills = _phase(stats, 'insert_spill_code', insert_spill_code, il, spilled)
+            pieces = {}
+        longer = set()
+        if eliminate_redundant:
+            # A register is lengthened at most once, spilling it again gives it minimal ranges for good
+            removed, removed_cost, longer = _phase(stats, 'eliminate_redundant_memory_ops',
+                                                   eliminate_redundant_memory_ops, il, spilled - lengthened, 1,
+                                                   split_pieces)
+            lengthened |= longer
+            if stats is not None:
+                stats.memory_ops_removed += removed
+                stats.memory_cost_removed += removed_cost
+        if allocator == 'irc':
+            # Coalescing renamed nodes in the graph, so the next round builds a new one
+            graph = None
+            edges_added = 0
+        elif allocator == 'linear_scan':
+            edges_added = 0
+        else:
+            edges_added = _phase(stats, 'update_graph_after_spill', update_graph_after_spill, il, graph,
+                                 spilled | set(pieces))
+        if stats is not None:
+            stats.spill_rounds += 1
+            stats.reloads_inserted += reloads
+            stats.spills_inserted += spills
+            stats.edges_added += edges_added
+            stats.spill_cost += memory_traffic(il) - traffic
+
+        # Lengthened ranges can interfere with each other, so those registers may have to be spilled again
+        spilled_before |= spilled - longer
+        spill_round += 1
+
+    if spill_round > 0 and coloring is not None and visualize is not None and graph is not None:
+        visualize(graph, coloring, 'Colored')
 
     return graph, coloring
 
 
-def color_il(il: IntermediateLanguage, colors: List[str]) -> Tuple[Optional[Graph], Optional[Dict[str, str]]]:
-    graph = build_graph(il)
-    graph.plot({}, 'Initial')
-    coalesce_nodes(il, graph)
-    # graph.plot({}, 'After Coalescing')
-    coloring = color_graph(graph, il.registers(), colors)
+def choose_allocator(il: IntermediateLanguage, threshold: int = LINEAR_SCAN_THRESHOLD) -> str:
+    """
+    Picks the allocator for one function by its size. Building the interference graph dominates the time spent on
+    large functions, so those are allocated by linear scan and the rest by graph coloring.
+
+    :return: ``'linear_scan'`` for functions of at least ``threshold`` instructions, otherwise ``'chaitin'``
+    """
+    return 'linear_scan' if len(il.instructions) >= threshold else 'chaitin'
 
-    if coloring is None:
-        return graph, None
 
-    # graph.plot(coloring, 'Colored')
+def color_il(il: IntermediateLanguage,
+             colors: List[str],
+             visualize: Optional[Visualizer] = None,
+             graph: Optional[Graph] = None,
+             stats: Optional[AllocationStats] = None,
+             optimistic: bool = False,
+             seed: Optional[int] = None) -> Tuple[Optional[Graph], Optional[Dict[str, str]]]:
+    """
+    Builds the interference graph, coalesces copies and colors the graph.
+
+    :param graph: An interference graph that is already up to date with ``il``, used instead of building one
+    :param optimistic: Use ``color_graph_optimistic`` instead of ``color_graph``
+    """
+    graph, coloring, _ = _color_round(il, colors, visualize, graph, stats, optimistic, set(), seed, 'chaitin')
     return graph, coloring
 
 
-def build_graph(il: IntermediateLanguage) -> Graph:
-    graph = Graph()
+def _color_round(il: IntermediateLanguage,
+                 colors: List[str],
+                 visualize: Optional[Visualizer],
+                 graph: Optional[Graph],
+                 stats: Optional[AllocationStats],
+                 optimistic: bool,
+                 spilled_before: Set[str],
+                 seed: Optional[int],
+                 allocator: str) -> Tuple[Graph, Optional[Dict[str, str]], Optional[Set[str]]]:
+    """
+    :return: The graph, the coloring or None, and the registers optimistic coloring failed to color
+    """
+    if allocator == 'linear_scan':
+        cost = _phase(stats, 'estimate_spill_costs', estimate_spill_costs, il)
+        for reg in spilled_before:
+            cost[reg] = float('inf')
+        coloring, spilled = _phase(stats, 'linear_scan', linear_scan, il, colors, cost, stats)
+        return graph, coloring, spilled or None
+
+    if graph is None:
+        graph = _phase(stats, 'build_graph', build_graph, il)
+        if stats is not None:
+            stats.edges_added += graph.edge_count()
+    if visualize is not None:
+        visualize(graph, {}, 'Initial')
+
+    if allocator == 'irc':
+        cost = _phase(stats, 'estimate_spill_costs', estimate_spill_costs, il)
+        for reg in spilled_before:
+            cost[reg] = float('inf')
+        coloring, spilled = _phase(stats, 'iterated_register_coalescing', iterated_register_coalescing, il, graph,
+                                   colors, cost, stats, seed, spilled_before)
+        return graph, coloring, spilled or None
+
+    if allocator == 'chordal':
+        # Coalescing can break chordality, so a chordal graph is colored as built
+        coloring, clique = _phase(stats, 'color_graph', color_graph_chordal, graph, il.registers(), colors, stats)
+        if clique is not None:
+            return graph, coloring, None
+
+    merges = _phase(stats, 'coalesce_nodes', coalesce_nodes, il, graph, spilled_before)
+    if stats is not None:
+        stats.coalesce_iterations += merges
+    # graph.plot({}, 'After Coalescing')
+
+    if not optimistic:
+        coloring = _phase(stats, 'color_graph', color_graph, graph, il.registers(), colors, stats, seed)
+        # graph.plot(coloring, 'Colored')
+        return graph, coloring, None
+
+    cost = _phase(stats, 'estimate_spill_costs', estimate_spill_costs, il)
+    for reg in spilled_before:
+        cost[reg] = float('inf')
+    coloring, spilled = _phase(stats, 'color_graph', color_graph_optimistic, graph, il.registers(), colors, cost,
+                               stats, seed)
+    if spilled:
+        return graph, None, spilled
+    return graph, coloring, None
+
+
+def build_graph(il: IntermediateLanguage,
+                backend=SetAdjacency,
+                live_in: Optional[List[Collection[str]]] = None) -> Graph:
+    """
+    :param live_in: The registers live on entry to each basic block, as computed by ``solve_liveness``. When omitted
+        the non-dead decs of each ``'bb'`` instruction are used.
+    """
+    graph = Graph(backend)
+    if isinstance(il, CompactIntermediateLanguage):
+        _add_compact_interference(il, graph, live_in)
+    else:
+        add_interference(il, graph, live_in=live_in)
+    return graph
+
+
+def build_graph_parallel(il,
+                         backend=SetAdjacency,
+                         live_in: Optional[List[Collection[str]]] = None,
+                         processes: Optional[int] = None,
+                         executor: Optional[Executor] = None,
+                         threshold: int = PARALLEL_BUILD_THRESHOLD) -> Graph:
+    """
+    Builds the same graph as ``build_graph`` with the basic blocks shared out between worker processes.
+
+    Liveness restarts at every ``'bb'`` instruction from its decs, or from ``live_in``, so blocks are independent.
+    The IL is converted to a ``CompactIntermediateLanguage``, whose integer arrays pickle cheaply, and cut at block
+    boundaries into a few chunks per process. Each worker replays liveness over its chunk and returns the neighbor
+    IDs of every register, and the rows are merged into one graph with ``Graph.add_row``. Functions smaller than
+    ``threshold`` instructions, with a single worker process or with too few blocks to cut into two chunks are built
+    serially.
+
+    :param il: An ``IntermediateLanguage`` or a ``CompactIntermediateLanguage``, which is used without converting it
+    :param processes: Number of worker processes, defaults to the number of CPUs
+    :param executor: Optional executor to run the chunks on instead of starting a process pool for this call
+    """
+    compact = il if isinstance(il, CompactIntermediateLanguage) else None
+    if len(il if compact is not None else il.instructions) < threshold:
+        return build_graph(il, backend, live_in)
+
+    workers = processes or os.cpu_count() or 1
+    if executor is None and workers <= 1:
+        return build_graph(il, backend, live_in)
+
+    if compact is None:
+        compact = CompactIntermediateLanguage.from_il(il)
+    bb = compact.opcode_ids.get('bb')
+    chunks = _block_chunks(compact.opcodes, bb, 4 * workers)
+    if len(chunks) < 2:
+        return build_graph(il, backend, live_in)
+
+    arguments = []
+    block = 0
+    for start, end in chunks:
+        chunk = _compact_chunk(compact, start, end)
+        blocks = chunk[0].count(bb)
+        chunk_live_in = None
+        if live_in is not None:
+            chunk_live_in = [[compact.register_ids[reg] for reg in registers]
+                             for registers in live_in[block:block + blocks]]
+        arguments.append((chunk, bb, chunk_live_in, compact.register_names))
+        block += blocks
+
+    graph = Graph(backend)
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            _merge_rows(graph, pool, arguments)
+    else:
+        _merge_rows(graph, executor, arguments)
+    return graph
+
+
+def _block_chunks(opcodes: array, bb: int, count: int) -> List[Tuple[int, int]]:
+    """
+    :return: Up to ``count`` ranges of instructions of about equal size, each starting at a ``'bb'`` instruction
+    """
+    size = max(1, len(opcodes) // count)
+    chunks = []
+    start = 0
+    for index, opcode in enumerate(opcodes):
+        if opcode == bb and index - start >= size:
+            chunks.append((start, index))
+            start = index
+    chunks.append((start, len(opcodes)))
+    return chunks
+
+
+def _compact_chunk(compact: CompactIntermediateLanguage, start: int, end: int) -> Tuple[array, ...]:
+    """
+    :return: The opcodes and operand arrays of instructions ``start`` to ``end``, with offsets rebased to zero
+    """
+    dec_start = compact.dec_offsets[start]
+    dec_end = compact.dec_offsets[end]
+    use_start = compact.use_offsets[start]
+    use_end = compact.use_offsets[end]
+    return (
+        compact.opcodes[start:end],
+        array('q', [offset - dec_start for offset in compact.dec_offsets[start:end + 1]]),
+        compact.dec_registers[dec_start:dec_end],
+        compact.dec_dead[dec_start:dec_end],
+        array('q', [offset - use_start for offset in compact.use_offsets[start:end + 1]]),
+        compact.use_registers[use_start:use_end],
+        compact.use_dead[use_start:use_end]
+    )
+
+
+def _merge_rows(graph: Graph, executor: Executor, arguments: List[Tuple]) -> None:
+    futures = [executor.submit(_interference_rows, *chunk) for chunk in arguments]
+    # Merged in chunk order so the graph is the same whichever worker finishes first
+    for future in futures:
+        for reg, row in future.result():
+            graph.add_row(reg, row)
+
+
+def _interference_rows(chunk: Tuple[array, ...], bb: int, live_in: Optional[List[List[int]]],
+                       names: List[str]) -> List[Tuple[str, List[str]]]:
+    """
+    Replays liveness over one chunk of blocks in a worker, with the rules of ``add_interference``.
+
+    The rows are returned by name rather than ID: pickle sends every name once per chunk, and the parent then only
+    has to copy each row into the graph.
+
+    :return: The neighbors of every register with an edge in the chunk, holding both directions of every edge
+    """
+    opcodes, dec_offsets, dec_registers, dec_dead, use_offsets, use_registers, use_dead = chunk
+    rows = {}
+    liveness = {}
+    block = -1
+
+    for index, opcode in enumerate(opcodes):
+        if opcode == bb:
+            liveness = {}
+            block += 1
+            if live_in is None:
+                defined = [dec_registers[i] for i in range(dec_offsets[index], dec_offsets[index + 1])
+                           if not dec_dead[i]]
+            else:
+                defined = live_in[block]
+        else:
+            for i in range(use_offsets[index], use_offsets[index + 1]):
+                if use_dead[i]:
+                    reg = use_registers[i]
+                    count = liveness[reg] - 1
+                    if count == 0:
+                        del liveness[reg]
+                    else:
+                        liveness[reg] = count
+
+            defined = []
+            for i in range(dec_offsets[index], dec_offsets[index + 1]):
+                reg = dec_registers[i]
+                if liveness:
+                    row = rows.get(reg)
+                    if row is None:
+                        row = rows[reg] = set()
+                    row.update(liveness)
+                    for neighbor in liveness:
+                        neighbor_row = rows.get(neighbor)
+                        if neighbor_row is None:
+                            rows[neighbor] = {reg}
+                        else:
+                            neighbor_row.add(reg)
+                if not dec_dead[i]:
+                    defined.append(reg)
+
+        for reg in defined:
+            liveness[reg] = liveness.get(reg, 0) + 1
+
+    result = []
+    for reg, row in rows.items():
+        row.discard(reg)
+        if row:
+            result.append((names[reg], [names[neighbor] for neighbor in row]))
+    return result
+
+
+def add_interference(il: IntermediateLanguage,
+                     graph: Graph,
+                     only: Optional[Set[str]] = None,
+                     live_in: Optional[List[Collection[str]]] = None,
+                     blocks: Optional[Collection[int]] = None) -> int:
+    """
+    Replays liveness over the IL and adds the interference edges it finds to ``graph``.
+
+    A definition interferes with every register live at that point, so its edges are added to the graph in one bulk
+    update per definition rather than one call per pair. When the graph stores bitset rows the live set is also kept
+    as a Python int over the graph's interned IDs, and each definition becomes a single row OR.
+
+    :param only: When given, only edges with at least one endpoint in this set are added
+    :param live_in: Optional registers live on entry to each basic block, used instead of the ``'bb'`` decs
+    :param blocks: When given, only the basic blocks with these indices are replayed
+    :return: The number of edges added
+    """
+    intern = graph.intern if graph.bitset_rows else None
+    only_mask = 0
+    if intern is not None and only is not None:
+        for reg in only:
+            only_mask |= 1 << intern(reg)
+
+    edges_added = 0
     liveness = None
+    live_only = None
+    live = 0
+    block = -1
+    skipped = False
 
     for instruction in il.instructions:
         if instruction.opcode == 'bb':
+            block += 1
+            skipped = blocks is not None and block not in blocks
+            if skipped:
+                continue
             liveness = {}
-
-            for dec in [dec for dec in instruction.dec if not dec.dead]:
-                liveness[dec.reg] = liveness.get(dec.reg, 0) + 1
-
+            live_only = {}
+            live = 0
+            if live_in is None:
+                defined = [dec.reg for dec in instruction.dec if not dec.dead]
+            else:
+                defined = live_in[block]
+        elif skipped:
+            continue
         else:
             for use in [use for use in instruction.use if use.dead]:
                 liveness[use.reg] -= 1
                 if liveness[use.reg] == 0:
                     liveness.pop(use.reg)
+                    live_only.pop(use.reg, None)
+                    if intern is not None:
+                        live &= ~(1 << intern(use.reg))
+
             for dec in instruction.dec:
-                for key, value in liveness.items():
-                    if key != dec.reg:
-                        graph.add_edge(dec.reg, key)
-                if not dec.dead:
-                    liveness[dec.reg] = liveness.get(dec.reg, 0) + 1
+                if only is None or dec.reg in only:
+                    ys = liveness
+                    mask = live
+                else:
+                    ys = live_only
+                    mask = live & only_mask
+
+                if ys and (len(ys) > 1 or dec.reg not in ys):
+                    edges_added += graph.add_edges(dec.reg, list(ys), mask if intern is not None else None)
+
+            defined = [dec.reg for dec in instruction.dec if not dec.dead]
+
+        for reg in defined:
+            liveness[reg] = liveness.get(reg, 0) + 1
+            if only is not None and reg in only:
+                live_only[reg] = None
+            if intern is not None:
+                live |= 1 << intern(reg)
+
+    return edges_added
+
+
+def _add_compact_interference(compact: CompactIntermediateLanguage,
+                              graph: Graph,
+                              live_in: Optional[List[Collection[str]]] = None) -> None:
+    """
+    Adds the edges of ``add_interference`` by replaying liveness over the arrays of ``compact`` directly, without
+    building an ``Instruction`` for every entry as its ``instructions`` property does.
+    """
+    intern = graph.intern if graph.bitset_rows else None
+    names = compact.register_names
+    bb = compact.opcode_ids.get('bb')
+    dec_offsets, dec_registers, dec_dead = compact.dec_offsets, compact.dec_registers, compact.dec_dead
+    use_offsets, use_registers, use_dead = compact.use_offsets, compact.use_registers, compact.use_dead
+    liveness = None
+    live = 0
+    block = -1
+
+    for index, opcode in enumerate(compact.opcodes):
+        if opcode == bb:
+            liveness = {}
+            live = 0
+            block += 1
+            if live_in is None:
+                defined = [names[dec_registers[i]] for i in range(dec_offsets[index], dec_offsets[index + 1])
+                           if not dec_dead[i]]
+            else:
+                defined = live_in[block]
+        else:
+            for i in range(use_offsets[index], use_offsets[index + 1]):
+                if use_dead[i]:
+                    reg = names[use_registers[i]]
+                    count = liveness[reg] - 1
+                    if count == 0:
+                        del liveness[reg]
+                        if intern is not None:
+                            live &= ~(1 << intern(reg))
+                    else:
+                        liveness[reg] = count
+
+            defined = []
+            for i in range(dec_offsets[index], dec_offsets[index + 1]):
+                reg = names[dec_registers[i]]
+                if liveness and (len(liveness) > 1 or reg not in liveness):
+                    graph.add_edges(reg, list(liveness), live if intern is not None else None)
+                if not dec_dead[i]:
+                    defined.append(reg)
+
+        for reg in defined:
+            liveness[reg] = liveness.get(reg, 0) + 1
+            if intern is not None:
+                live |= 1 << intern(reg)
+
+
+def update_graph_after_spill(il: IntermediateLanguage, graph: Graph, spilled: Set[str]) -> int:
+    """
+    Patches an interference graph after ``insert_spill_code`` instead of rebuilding it.
+
+    Spill code only changes the live ranges of the spilled registers: their long ranges are replaced by short ones
+    around each reload and spill, while every other register keeps its range. The spilled nodes are therefore removed
+    and liveness is replayed adding only the edges that touch a spilled register. Liveness starts over at every
+    ``'bb'``, so only the blocks that mention a spilled register are replayed.
+
+    :param il: The intermediate language after spill code has been inserted
+    :param graph: The interference graph of the IL before spilling, updated in place
+    :param spilled: The spilled symbolic registers
+    :return: The number of edges added
+    """
+    for reg in spilled:
+        graph.remove_node(reg)
+
+    blocks = set()
+    block = -1
+    for instruction in il.instructions:
+        if instruction.opcode == 'bb':
+            block += 1
+        if block not in blocks and any(operand.reg in spilled for operand in instruction.dec + instruction.use):
+            blocks.add(block)
+
+    return add_interference(il, graph, spilled, blocks=blocks)
 
-    return graph
+
+class ControlFlowGraph:
+    """
+    The control flow between the basic blocks of an IL. Blocks are numbered in the order of their ``'bb'``
+    instructions and ``successors[b]`` lists the blocks control can reach directly from block ``b``.
+    """
+
+    def __init__(self, successors: List[List[int]]):
+        self.successors = successors
+        self.predecessors = [[] for _ in successors]
+        for block, block_successors in enumerate(successors):
+            for successor in block_successors:
+                self.predecessors[successor].append(block)
+
+    def __len__(self):
+        return len(self.successors)
+
+    def postorder(self, entry: int = 0) -> List[int]:
+        """
+        :return: The blocks reachable from ``entry`` in depth first postorder followed by any unreachable blocks
+        """
+        order = []
+        visited = [False] * len(self.successors)
+        visited[entry] = True
+        stack = [(entry, iter(self.successors[entry]))]
+
+        while stack:
+            block, successors = stack[-1]
+            successor = next(successors, None)
+            if successor is None:
+                stack.pop()
+                order.append(block)
+            elif not visited[successor]:
+                visited[successor] = True
+                stack.append((successor, iter(self.successors[successor])))
+
+        order.extend(block for block in range(len(self.successors)) if not visited[block])
+        return order
+
+
+def solve_liveness(il: IntermediateLanguage, cfg: ControlFlowGraph) -> Tuple[List[Set[str]], List[Set[str]]]:
+    """
+    Computes the registers live on entry to and exit from every basic block with a backward dataflow worklist.
+
+    Each block is summarized by the registers it reads before writing them (gen) and the registers it writes (kill),
+    as bitsets over interned register IDs. Then ``live_out(b)`` is the union of ``live_in`` over the successors of
+    ``b`` and ``live_in(b) = gen(b) | (live_out(b) & ~kill(b))``. The worklist starts in postorder so successors are
+    usually solved before their predecessors and loops converge in a few passes. The ``'bb'`` decs are ignored.
+
+    :return: The live-in and live-out register sets of every block
+    """
+    ids = {}
+    gen = []
+    kill = []
+
+    for instruction in il.instructions:
+        if instruction.opcode == 'bb':
+            gen.append(0)
+            kill.append(0)
+            continue
+
+        for use in instruction.use:
+            bit = 1 << ids.setdefault(use.reg, len(ids))
+            if not kill[-1] & bit:
+                gen[-1] |= bit
+        for dec in instruction.dec:
+            kill[-1] |= 1 << ids.setdefault(dec.reg, len(ids))
+
+    if len(gen) != len(cfg):
+        raise ValueError('the IL has {} basic blocks but the control flow graph has {}'.format(len(gen), len(cfg)))
+
+    live_in = [0] * len(cfg)
+    live_out = [0] * len(cfg)
+    worklist = deque(cfg.postorder())
+    pending = [True] * len(cfg)
+
+    while worklist:
+        block = worklist.popleft()
+        pending[block] = False
+
+        out = 0
+        for successor in cfg.successors[block]:
+            out |= live_in[successor]
+        live_out[block] = out
+
+        new_in = gen[block] | (out & ~kill[block])
+        if new_in != live_in[block]:
+            live_in[block] = new_in
+            for predecessor in cfg.predecessors[block]:
+                if not pending[predecessor]:
+                    pending[predecessor] = True
+                    worklist.append(predecessor)
+
+    names = sorted(ids, key=ids.get)
+
+    def registers(mask: int) -> Set[str]:
+        return {names[reg_id] for reg_id in _iter_bits(mask)}
+
+    return [registers(mask) for mask in live_in], [registers(mask) for mask in live_out]
+
+
+def annotate_live_in(il: IntermediateLanguage, live_in: List[Collection[str]]) -> None:
+    """
+    Replaces the decs of every ``'bb'`` instruction with the computed live-in registers of its block, so later passes
+    such as ``insert_spill_code`` and every rebuild of the graph see the same liveness.
+    """
+    block = 0
+    for instruction in il.instructions:
+        if instruction.opcode == 'bb':
+            instruction.dec = [Dec(reg, False) for reg in sorted(live_in[block])]
+            block += 1
 
 
 def is_unnecessary_copy(instruction: Instruction, graph: Graph) -> bool:
@@ -194,49 +1350,294 @@ def is_unnecessary_copy(instruction: Instruction, graph: Graph) -> bool:
             not graph.contains_edge(source, target))
 
 
-def coalesce_nodes(il: IntermediateLanguage, graph: Graph) -> None:
-    modified = True
+class UnionFind:
+    """
+    Disjoint sets of register names with path compression. Each set is an alias class of coalesced registers.
+    """
+
+    def __init__(self):
+        self._parent = {}
+
+    def find(self, x):
+        root = x
+        while self._parent.get(root, root) != root:
+            root = self._parent[root]
+
+        while x != root:
+            self._parent[x], x = root, self._parent[x]
 
-    while modified:
-        found = next((instruction for instruction in il.instructions if is_unnecessary_copy(instruction, graph)), None)
-        if found is not None:
-            source = found.dec[0].reg
-            target = found.use[0].reg
+        return root
 
-            f = {source: target}
+    def union(self, x, y) -> None:
+        """
+        Merges the class of ``x`` into the class of ``y``. The root of ``y`` stays the representative.
+        """
+        x_root = self.find(x)
+        y_root = self.find(y)
+        if x_root != y_root:
+            self._parent[x_root] = y_root
+
+    def mapping(self) -> Dict:
+        """
+        :return: A map from every merged register to the representative of its class
+        """
+        return {x: self.find(x) for x in list(self._parent)}
+
+
+def coalesce_nodes(il: IntermediateLanguage, graph: Graph, spilled: Collection[str] = ()) -> int:
+    """
+    Coalesces the source and target of every copy whose registers do not interfere.
 
+    The copies are gathered in one pass over the IL and visited in instruction order. Registers are merged into alias
+    classes with a union-find, the graph is updated with one ``rename_node`` per merge and the IL is rewritten once at
+    the end. Merging only adds interferences, so a copy rejected earlier can never become coalescable later and a
+    single pass reaches the same fixed point as rescanning after every merge.
+
+    :param spilled: Registers created by spill code, which are not coalesced since the merged node would carry the
+        range of the other register but could not be spilled again. Registers reloaded or spilled in the IL are never
+        coalesced either, since renaming them would move their spill code to the memory of another register.
+    :return: The number of merges performed
+    """
+    fixed = _spill_code_registers(il, spilled)
+    copies = [(instruction.dec[0].reg, instruction.use[0].reg)
+              for instruction in il.instructions
+              if instruction.opcode == 'copy' and len(instruction.dec) != 0 and len(instruction.use) != 0 and
+              instruction.dec[0].reg not in fixed and instruction.use[0].reg not in fixed]
+
+    aliases = UnionFind()
+    merges = 0
+
+    for source, target in copies:
+        source = aliases.find(source)
+        target = aliases.find(target)
+
+        if source != target and not graph.contains_edge(source, target):
             graph.rename_node(source, target)
-            il.rewrite_il(f)
-        else:
-            modified = False
+            aliases.union(source, target)
+            merges += 1
 
+    if merges != 0:
+        il.rewrite_il(aliases.mapping())
 
-def color_graph(g: Graph, n: Collection[str], colors: List[str]) -> Optional[Dict[str, str]]:
-    if len(n) == 0:
-        return {}
+    return merges
 
-    node = next((node for node in n if len(g.neighbors(node)) < len(colors)), None)
-    if node is None:
-        return None
 
-    g_copy = copy.copy(g)
-    g_copy.remove_node(node)
-    coloring = color_graph(g_copy, [n for n in n if n != node], colors)
-    if coloring is None:
+def _spill_code_registers(il: IntermediateLanguage, spilled: Collection[str]) -> Set[str]:
+    """
+    :return: The registers in ``spilled`` and the registers reloaded or spilled in the IL, which name their memory
+    """
+    fixed = set(spilled)
+    for instruction in il.instructions:
+        if instruction.opcode == 'reload':
+            fixed.update(dec.reg for dec in instruction.dec)
+        elif instruction.opcode == 'spill':
+            fixed.update(use.reg for use in instruction.use)
+    return fixed
+
+
+class DegreeWorklist:
+    """
+    Tracks the remaining degree of every node while nodes are removed from an interference graph, through a
+    ``GraphOverlay`` so the graph itself is neither copied nor changed.
+
+    Nodes whose remaining degree is below ``k`` are kept in a low-degree set so one can be found in O(1). When a cost
+    map is given, the remaining nodes are also kept in a heap keyed on cost, or on cost divided by remaining degree
+    with ``by_degree``, so the cheapest spill candidate is found in O(log n). Removing a node costs O(degree) plus
+    heap maintenance.
+    """
+
+    def __init__(self, graph: Graph, nodes: Collection[str], k: int, cost: Optional[Dict[str, float]] = None,
+                 by_degree: bool = False):
+        self._remaining = dict.fromkeys(nodes)
+        self._overlay = GraphOverlay(graph, self._remaining)
+        self._k = k
+        self._low = {node: None for node in self._remaining if self._overlay.degree(node) < k}
+        self._heap = None
+        self._cost = cost
+        self._by_degree = by_degree and cost is not None
+
+        if cost is not None:
+            self._heap = [(self._key(node), index, node) for index, node in enumerate(self._remaining)]
+            self._pushes = len(self._heap)
+            heapq.heapify(self._heap)
+
+    def _key(self, node) -> float:
+        if not self._by_degree:
+            return self._cost[node]
+        # Nodes of degree zero are always low, so they are never taken as spill candidates
+        return self._cost[node] / max(1, self._overlay.degree(node))
+
+    def __len__(self):
+        return len(self._remaining)
+
+    def __contains__(self, node):
+        return node in self._remaining
+
+    def degree(self, node) -> int:
+        return self._overlay.degree(node)
+
+    def low_node(self) -> Optional[str]:
+        """
+        :return: A remaining node with fewer than ``k`` remaining neighbors, or None if there is none
+        """
+        return next(reversed(self._low), None)
+
+    def cheapest_node(self) -> Optional[str]:
+        """
+        :return: The remaining node with the lowest cost, or cost per remaining neighbor, or None if the worklist is
+            empty
+        """
+        heap = self._heap
+        while heap and (heap[0][2] not in self._remaining or
+                        self._by_degree and heap[0][0] != self._key(heap[0][2])):
+            # Removed nodes, and with by_degree the entries keyed on an earlier degree, are dropped lazily
+            heapq.heappop(heap)
+        return heap[0][2] if heap else None
+
+    def remove(self, node) -> None:
+        del self._remaining[node]
+        self._low.pop(node, None)
+
+        low_degree = self._k - 1
+        for neighbor, degree in self._overlay.remove_node(node).items():
+            if degree == low_degree:
+                if neighbor in self._remaining:
+                    self._low[neighbor] = None
+            elif self._by_degree and degree > low_degree and neighbor in self._remaining:
+                # The old entry is stale now, see cheapest_node
+                heapq.heappush(self._heap, (self._key(neighbor), self._pushes, neighbor))
+                self._pushes += 1
+
+
+def color_graph(g: Graph,
+                n: Collection[str],
+                colors: List[str],
+                stats: Optional['AllocationStats'] = None,
+                seed: Optional[int] = None) -> Optional[Dict[str, str]]:
+    """
+    Colors the nodes ``n`` of ``g`` with Chaitin's simplify/select scheme.
+
+    Simplify repeatedly removes a node with fewer than ``len(colors)`` remaining neighbors and pushes it on a stack.
+    Select then pops the stack and gives each node a color not used by its already colored neighbors. Degrees are
+    tracked by a ``DegreeWorklist`` instead of removing nodes from a copy of the graph, so the whole pass is O(V + E).
+
+    :param seed: Seed for the random color choices. Nodes are also visited in sorted order so the coloring is
+        repeatable across processes.
+    :return: The coloring, or None if simplify gets stuck before every node is removed
+    """
+    rng = Random(seed)
+    if seed is not None:
+        n = sorted(n)
+    worklist = DegreeWorklist(g, n, len(colors))
+    stack = []
+
+    node = worklist.low_node()
+    while node is not None:
+        worklist.remove(node)
+        stack.append(node)
+        node = worklist.low_node()
+
+    if stats is not None:
+        stats.simplify_steps += len(stack)
+
+    if len(worklist) != 0:
         return None
 
-    neighbor_colors = [coloring[neighbor] for neighbor in g.neighbors(node)]
-    coloring[node] = choice([color for color in colors if color not in neighbor_colors])
+    coloring = {}
+    while stack:
+        node = stack.pop()
+        neighbor_colors = {coloring[neighbor] for neighbor in g.neighbors(node) if neighbor in coloring}
+        coloring[node] = rng.choice([color for color in colors if color not in neighbor_colors])
 
     return coloring
 
 
+def color_graph_optimistic(g: Graph,
+                           n: Collection[str],
+                           colors: List[str],
+                           cost: Dict[str, float],
+                           stats: Optional[AllocationStats] = None,
+                           seed: Optional[int] = None) -> Tuple[Dict[str, str], Set[str]]:
+    """
+    Colors the nodes ``n`` of ``g`` with Briggs' optimistic variant of simplify/select.
+
+    When simplify gets stuck, the remaining node with the lowest cost per remaining neighbor is pushed on the stack
+    as a potential spill instead of being spilled outright. Select may still find a color for it when its neighbors
+    end up sharing colors, and only the nodes left without a color are spilled.
+
+    :param seed: Seed for the random color choices, as in ``color_graph``
+    :return: The coloring of every colored node and the set of nodes that must be spilled
+    """
+    rng = Random(seed)
+    if seed is not None:
+        n = sorted(n)
+    worklist = DegreeWorklist(g, n, len(colors), cost, by_degree=True)
+    stack = []
+
+    while len(worklist) != 0:
+        node = worklist.low_node()
+        if node is None:
+            node = worklist.cheapest_node()
+            if stats is not None:
+                stats.spill_candidates += 1
+        worklist.remove(node)
+        stack.append(node)
+
+    if stats is not None:
+        stats.simplify_steps += len(stack)
+
+    coloring = {}
+    spilled = set()
+    while stack:
+        node = stack.pop()
+        neighbor_colors = {coloring[neighbor] for neighbor in g.neighbors(node) if neighbor in coloring}
+        available = [color for color in colors if color not in neighbor_colors]
+        if available:
+            coloring[node] = rng.choice(available)
+        else:
+            spilled.add(node)
+
+    return coloring, spilled
+
+
+def _rematerializable(definitions: Dict[str, Instruction], def_counts: Dict[str, int]) -> Dict[str, Instruction]:
+    # A copy of the definition computes the same value anywhere only if neither the register nor its operands are
+    # ever redefined
+    return {reg: instruction for reg, instruction in definitions.items()
+            if def_counts[reg] == 1 and len(instruction.dec) == 1 and
+            all(use.reg != reg and def_counts.get(use.reg, 0) <= 1 for use in instruction.use)}
+
+
+def rematerializable_registers(il: IntermediateLanguage) -> Dict[str, Instruction]:
+    """
+    :return: The registers defined once, by a rematerializable instruction whose operands are never redefined, mapped
+        to that instruction
+    """
+    definitions = {}
+    def_counts = {}
+
+    for instruction in il.instructions:
+        if instruction.opcode != 'bb':
+            for dec in instruction.dec:
+                def_counts[dec.reg] = def_counts.get(dec.reg, 0) + 1
+                if instruction.rematerializable:
+                    definitions[dec.reg] = instruction
+
+    return _rematerializable(definitions, def_counts)
+
+
 def estimate_spill_costs(il: IntermediateLanguage) -> Dict[str, float]:
     """
+    Rematerializable registers need no store and recomputing them is cheaper than a reload, so their cost is only
+    their uses weighted by ``REMAT_COST``.
+
     :param il: The intermediate language to compute spill costs on.
     :return: The estimated cost of spilling each symbolic register
     """
     cost = {}
+    use_cost = {}
+    definitions = {}
+    def_counts = {}
 
     frequency = None
 
@@ -248,11 +1649,19 @@ def estimate_spill_costs(il: IntermediateLanguage) -> Dict[str, float]:
 
             for dec in instruction.dec:
                 registers.add(dec.reg)
+                def_counts[dec.reg] = def_counts.get(dec.reg, 0) + 1
+                if instruction.rematerializable:
+                    definitions[dec.reg] = instruction
             for use in instruction.use:
                 registers.add(use.reg)
 
             for reg in registers:
                 cost[reg] = cost.get(reg, 0) + frequency
+            for reg in {use.reg for use in instruction.use}:
+                use_cost[reg] = use_cost.get(reg, 0) + frequency
+
+    for reg in _rematerializable(definitions, def_counts):
+        cost[reg] = REMAT_COST * use_cost.get(reg, 0)
 
     return cost
 
@@ -269,23 +1678,29 @@ def decide_spills(il: IntermediateLanguage, graph: Graph, colors: List[str], cos
     """
     spilled = set()
 
-    g = copy.copy(graph)
-    n = il.registers()
+    # Sorted so ties between equally cheap candidates break the same way in every process
+    worklist = DegreeWorklist(graph, sorted(il.registers()), len(colors), cost)
 
-    while len(n) != 0:
-        node = next((node for node in n if len(g.neighbors(node)) < len(colors)), None)
+    while len(worklist) != 0:
+        node = worklist.low_node()
         if node is None:
-            node = next(x for x in n if cost[x] == min([cost[y] for y in n]))
+            node = worklist.cheapest_node()
             spilled.add(node)
 
-        g.remove_node(node)
-        n.remove(node)
+        worklist.remove(node)
 
     return spilled
 
 
-def insert_spill_code(il: IntermediateLanguage, spilled: Set[str]) -> None:
+def insert_spill_code(il: IntermediateLanguage, spilled: Set[str]) -> Tuple[int, int]:
+    """
+    Rewrites the IL so every spilled register is reloaded before each use and spilled after each definition.
+
+    :return: The number of reload and spill instructions inserted
+    """
     new_il = []
+    reloads = 0
+    spills = 0
 
     for instruction in il.instructions:
         if instruction.opcode == 'bb':
@@ -293,7 +1708,8 @@ def insert_spill_code(il: IntermediateLanguage, spilled: Set[str]) -> None:
                 Instruction(
                     'bb',
                     [dec for dec in instruction.dec if dec.reg not in spilled],
-                    instruction.use.copy()
+                    instruction.use.copy(),
+                    instruction.frequency
                 )
             )
         else:
@@ -323,6 +1739,907 @@ def insert_spill_code(il: IntermediateLanguage, spilled: Set[str]) -> None:
                 else:
                     newdef.append(Dec(dec.reg, dec.dead))
 
-            new_il.extend(before + [Instruction(instruction.opcode, newdef, newuse)] + after)
+            reloads += len(before)
+            spills += len(after)
+            new_il.extend(before + [Instruction(instruction.opcode, newdef, newuse, instruction.frequency,
+                                                instruction.rematerializable)] + after)
+
+    il.overwrite_il(new_il)
+    return reloads, spills
+
+
+def spill_everywhere_cost(il: IntermediateLanguage, spilled: Set[str]) -> float:
+    """
+    :return: The frequency weighted number of reloads and spills ``insert_spill_code`` would insert for ``spilled``
+    """
+    cost = 0
+    frequency = None
+
+    for instruction in il.instructions:
+        if instruction.opcode == 'bb':
+            frequency = instruction.frequency
+        else:
+            references = sum(1 for use in instruction.use if use.reg in spilled)
+            references += sum(1 for dec in instruction.dec if dec.reg in spilled)
+            cost += references * frequency
+
+    return cost
+
+
+def memory_traffic(il: IntermediateLanguage) -> float:
+    """
+    :return: The frequency weighted number of reload and spill instructions in the IL
+    """
+    traffic = 0
+    frequency = None
+
+    for instruction in il.instructions:
+        if instruction.opcode == 'bb':
+            frequency = instruction.frequency
+        elif instruction.opcode in ('reload', 'spill'):
+            traffic += frequency
+
+    return traffic
+
+
+def _split_blocks(il: IntermediateLanguage) -> List[Tuple[Instruction, List[Instruction]]]:
+    blocks = []
+    for instruction in il.instructions:
+        if instruction.opcode == 'bb':
+            blocks.append((instruction, []))
+        else:
+            blocks[-1][1].append(instruction)
+    return blocks
+
+
+def insert_split_code(il: IntermediateLanguage,
+                      spilled: Set[str],
+                      hot_frequency: Optional[float] = None,
+                      everywhere: Collection[str] = ()) -> Tuple[int, int, Dict[str, str]]:
+    """
+    Rewrites the IL so every spilled register lives in memory between basic blocks, splitting its live range at
+    block boundaries instead of spilling it around every reference.
+
+    In a hot block, one with a frequency of at least ``hot_frequency`` (every block when it is None), a spilled register
+    that is live across a block boundary and referenced more than once in the block is renamed to a block-local
+    register. It is reloaded once before its first use in the block and spilled once after its last definition, so the
+    memory traffic of the block no longer grows with the number of references. In cold blocks, and for the registers in
+    ``everywhere``, spill code is inserted around every reference as in ``insert_spill_code``, giving the shortest
+    ranges where memory traffic is cheapest.
+
+    The block-local registers are new nodes of the interference graph and may be spilled in a later round, in which
+    case they should be passed in ``everywhere`` since splitting them again would produce the same code.
+
+    :return: The number of reload and spill instructions inserted and the block-local registers created, mapped to
+        the spilled registers whose memory they share
+    """
+    registers = il.registers()
+    blocks = _split_blocks(il)
+    new_il = []
+    reloads = 0
+    spills = 0
+    pieces = {}
+
+    # A range that never crosses a block boundary would only be renamed, so it is spilled around every reference
+    crossing = {dec.reg for header, _ in blocks for dec in header.dec if not dec.dead and dec.reg in spilled}
+
+    for block, (header, body) in enumerate(blocks):
+        new_il.append(Instruction(
+            'bb',
+            [dec for dec in header.dec if dec.reg not in spilled],
+            header.use.copy(),
+            header.frequency
+        ))
+
+        local = {}
+        if hot_frequency is None or header.frequency >= hot_frequency:
+            references = {}
+            for instruction in body:
+                for operand in instruction.use + instruction.dec:
+                    if operand.reg in crossing and operand.reg not in everywhere:
+                        references[operand.reg] = references.get(operand.reg, 0) + 1
+
+            for reg, count in references.items():
+                if count > 1:
+                    piece = '{}@{}'.format(reg, block)
+                    while piece in registers:
+                        piece += "'"
+                    local[reg] = piece
+                    pieces[piece] = reg
+
+        # Walking the block backwards finds, after each instruction, whether the value of a local register is still
+        # read in the block and where its last definition is
+        needed_after = [None] * len(body)
+        last_def = {}
+        needed = dict.fromkeys(local, False)
+        for index in range(len(body) - 1, -1, -1):
+            instruction = body[index]
+            needed_after[index] = {reg: needed[reg] for reg in local}
+            for dec in instruction.dec:
+                if dec.reg in local:
+                    needed[dec.reg] = False
+                    if not dec.dead:
+                        last_def.setdefault(dec.reg, index)
+            for use in instruction.use:
+                if use.reg in local:
+                    needed[use.reg] = True
+
+        loaded = set()
+        for index, instruction in enumerate(body):
+            before = []
+            after = []
+            newuse = []
+            newdef = []
+            defined = {dec.reg for dec in instruction.dec}
+
+            last_use = {}
+            for position, use in enumerate(instruction.use):
+                last_use[use.reg] = position
+
+            for position, use in enumerate(instruction.use):
+                if use.reg in local:
+                    piece = local[use.reg]
+                    if use.reg not in loaded:
+                        before.append(Instruction('reload', [Dec(piece, False)], []))
+                        loaded.add(use.reg)
+                    # Only the last read of the value in the instruction ends its range
+                    dead = (position == last_use[use.reg] and
+                            (use.reg in defined or not needed_after[index][use.reg]))
+                    newuse.append(Use(piece, dead))
+                elif use.reg in spilled:
+                    newuse.append(Use(use.reg, True))
+                    before.append(Instruction('reload', [Dec(use.reg, False)], []))
+                else:
+                    newuse.append(Use(use.reg, use.dead))
+
+            for dec in instruction.dec:
+                if dec.reg in local:
+                    piece = local[dec.reg]
+                    loaded.add(dec.reg)
+                    stored = last_def.get(dec.reg) == index
+                    newdef.append(Dec(piece, dec.dead or not (stored or needed_after[index][dec.reg])))
+                    if stored:
+                        after.append(Instruction('spill', [], [Use(piece, not needed_after[index][dec.reg])]))
+                elif dec.reg in spilled:
+                    newdef.append(Dec(dec.reg, False))
+                    after.append(Instruction('spill', [], [Use(dec.reg, True)]))
+                else:
+                    newdef.append(Dec(dec.reg, dec.dead))
+
+            reloads += len(before)
+            spills += len(after)
+            new_il.extend(before + [Instruction(instruction.opcode, newdef, newuse, instruction.frequency,
+                                                instruction.rematerializable)] + after)
+
+    il.overwrite_il(new_il)
+    return reloads, spills, pieces
+
+
+def eliminate_redundant_memory_ops(il: IntermediateLanguage,
+                                   spilled: Set[str],
+                                   window: int = 1,
+                                   slots: Optional[Dict[str, str]] = None) -> Tuple[int, float, Set[str]]:
+    """
+    Removes reloads and spills made redundant by ``insert_spill_code`` within each basic block.
+
+    A reload is removed when the spilled register was last read or written no more than ``window`` instructions
+    earlier, not counting reloads and spills. The dead flag of that last read is cleared so the value stays in its
+    register until the next use. A spill is removed when the register is spilled again in the same block before it
+    is reloaded, or when it is never reloaded at all, and the read before it takes over ending the range.
+
+    Only the ranges of the spilled registers change, so ``update_graph_after_spill`` with the same registers keeps the
+    interference graph in step with the rewritten IL. Keeping ``window`` small keeps those ranges short, but a
+    value kept in its register now interferes with everything defined meanwhile, including other spilled
+    registers, so the registers whose reloads were removed are returned to be spilled again if needed.
+
+    ``slots`` maps the block-local registers of ``insert_split_code`` to the registers whose memory they share. A
+    spill is only redundant when no register sharing its memory is reloaded.
+
+    :return: The number of reloads and spills removed, the same number weighted by block frequency and the registers
+        whose ranges were lengthened
+    """
+    if slots is None:
+        slots = {}
+    removed = 0
+    weighted = 0
+    lengthened = set()
+    blocks = []
+
+    for header, body in _split_blocks(il):
+        kept = []
+        last_use = {}
+
+        position = 0
+        for instruction in body:
+            if instruction.opcode == 'reload' and instruction.dec[0].reg in spilled:
+                reg = instruction.dec[0].reg
+                use, at = last_use.pop(reg, (None, None))
+                if use is not None and use.dead and position - at <= window:
+                    use.dead = False
+                    lengthened.add(reg)
+                    removed += 1
+                    weighted += header.frequency
+                    continue
+            elif instruction.opcode not in ('reload', 'spill'):
+                position += 1
+
+            for use in instruction.use:
+                if use.reg in spilled:
+                    last_use[use.reg] = (use, position)
+            for dec in instruction.dec:
+                last_use.pop(dec.reg, None)
+            kept.append(instruction)
+
+        blocks.append((header, kept))
+
+    reloaded = {slots.get(instruction.dec[0].reg, instruction.dec[0].reg) for _, body in blocks
+                for instruction in body if instruction.opcode == 'reload'}
+
+    new_il = []
+    for header, body in blocks:
+        new_il.append(header)
+        dropped = set()
+        last_reference = {}
+        pending = {}
+
+        def drop(index, before):
+            dropped.add(index)
+            # The read or write before the dropped spill now ends the range
+            if body[index].use[0].dead and before is not None:
+                before.dead = True
+
+        for index, instruction in enumerate(body):
+            if instruction.opcode == 'reload':
+                pending.pop(slots.get(instruction.dec[0].reg, instruction.dec[0].reg), None)
+            elif instruction.opcode == 'spill' and instruction.use[0].reg in spilled:
+                use = instruction.use[0]
+                slot = slots.get(use.reg, use.reg)
+                if slot in pending:
+                    drop(*pending.pop(slot))
+                    removed += 1
+                    weighted += header.frequency
+
+                if slot in reloaded:
+                    pending[slot] = (index, last_reference.get(use.reg))
+                    last_reference[use.reg] = use
+                else:
+                    drop(index, last_reference.get(use.reg))
+                    removed += 1
+                    weighted += header.frequency
+                continue
+
+            for use in instruction.use:
+                if use.reg in spilled:
+                    last_reference[use.reg] = use
+            for dec in instruction.dec:
+                if dec.reg in spilled:
+                    last_reference[dec.reg] = dec
+
+        new_il.extend(instruction for index, instruction in enumerate(body) if index not in dropped)
 
     il.overwrite_il(new_il)
+    return removed, weighted, lengthened
+
+
+def insert_remat_code(il: IntermediateLanguage, spilled: Set[str]) -> Tuple[int, int, int]:
+    """
+    Rewrites the IL like ``insert_spill_code``, except that spilled rematerializable registers are recomputed by a
+    copy of their definition before each use instead of being stored and reloaded.
+
+    A copy reads the operands of the definition, so a register is only rematerialized when none of its operands is
+    spilled and every operand is live at each of its uses; otherwise it is spilled with reloads. The original
+    definition is kept with a dead dec and no spill.
+
+    :return: The number of reload, spill and rematerializing instructions inserted
+    """
+    remat = {reg: definition for reg, definition in rematerializable_registers(il).items()
+             if reg in spilled and not any(use.reg in spilled for use in definition.use)}
+
+    liveness = None
+    for instruction in il.instructions:
+        if instruction.opcode == 'bb':
+            liveness = {}
+            defined = [dec.reg for dec in instruction.dec if not dec.dead]
+        else:
+            for use in instruction.use:
+                if use.reg in remat and any(operand.reg not in liveness for operand in remat[use.reg].use):
+                    del remat[use.reg]
+
+            for use in instruction.use:
+                if use.dead:
+                    liveness[use.reg] -= 1
+                    if liveness[use.reg] == 0:
+                        del liveness[use.reg]
+            defined = [dec.reg for dec in instruction.dec if not dec.dead]
+
+        for reg in defined:
+            liveness[reg] = liveness.get(reg, 0) + 1
+
+    new_il = []
+    remats = 0
+
+    for instruction in il.instructions:
+        if instruction.opcode == 'bb':
+            new_il.append(Instruction(
+                'bb',
+                [dec for dec in instruction.dec if dec.reg not in remat],
+                instruction.use.copy(),
+                instruction.frequency
+            ))
+            continue
+
+        for use in instruction.use:
+            if use.reg in remat:
+                definition = remat[use.reg]
+                new_il.append(Instruction(
+                    definition.opcode,
+                    [Dec(use.reg, False)],
+                    [Use(operand.reg, False) for operand in definition.use],
+                    definition.frequency,
+                    True
+                ))
+                remats += 1
+
+        new_il.append(Instruction(
+            instruction.opcode,
+            [Dec(dec.reg, True) if dec.reg in remat else dec for dec in instruction.dec],
+            [Use(use.reg, True) if use.reg in remat else use for use in instruction.use],
+            instruction.frequency,
+            instruction.rematerializable
+        ))
+
+    il.overwrite_il(new_il)
+    reloads, spills = insert_spill_code(il, spilled - set(remat))
+    return reloads, spills, remats
+
+
+class _IteratedCoalescing:
+    """
+    The worklists and state of one run of ``iterated_register_coalescing``, named after Appel's presentation of the
+    algorithm. Coalescing renames nodes in the graph, so the adjacency of a node always names the representatives of
+    its neighbors.
+    """
+
+    def __init__(self, graph: Graph, nodes: Collection[str], moves: List[Tuple[str, str]], k: int,
+                 cost: Dict[str, float]):
+        self.graph = graph
+        self.k = k
+        self.cost = dict(cost)
+        self.moves = moves
+        self.degree = {node: graph.degree(node) for node in nodes}
+        self.alias = {}
+        self.select_stack = []
+        self.on_stack = set()
+        self.merges = 0
+        self.potential_spills = 0
+
+        self.move_list = {node: set() for node in self.degree}
+        for index, (x, y) in enumerate(moves):
+            self.move_list[x].add(index)
+            self.move_list[y].add(index)
+        self.worklist_moves = dict.fromkeys(range(len(moves)))
+        self.active_moves = set()
+
+        self.simplify_worklist = {}
+        self.freeze_worklist = {}
+        self.spill_worklist = {}
+        self._spill_heap = []
+        for node in self.degree:
+            if self.degree[node] >= k:
+                self._add_spill(node)
+            elif self.move_related(node):
+                self.freeze_worklist[node] = None
+            else:
+                self.simplify_worklist[node] = None
+
+    def _add_spill(self, node) -> None:
+        self.spill_worklist[node] = None
+        heapq.heappush(self._spill_heap, (self.cost.get(node, 0), len(self._spill_heap), node))
+
+    def get_alias(self, node):
+        while node in self.alias:
+            node = self.alias[node]
+        return node
+
+    def adjacent(self, node) -> List:
+        return [neighbor for neighbor in self.graph.neighbors(node) if neighbor not in self.on_stack]
+
+    def node_moves(self, node) -> List[int]:
+        return [move for move in self.move_list[node] if move in self.active_moves or move in self.worklist_moves]
+
+    def move_related(self, node) -> bool:
+        return any(move in self.active_moves or move in self.worklist_moves for move in self.move_list[node])
+
+    def enable_moves(self, nodes) -> None:
+        for node in nodes:
+            for move in self.node_moves(node):
+                if move in self.active_moves:
+                    self.active_moves.remove(move)
+                    self.worklist_moves[move] = None
+
+    def decrement_degree(self, node) -> None:
+        degree = self.degree[node]
+        self.degree[node] = degree - 1
+        if degree == self.k:
+            self.enable_moves([node] + self.adjacent(node))
+            self.spill_worklist.pop(node, None)
+            if self.move_related(node):
+                self.freeze_worklist[node] = None
+            else:
+                self.simplify_worklist[node] = None
+
+    def simplify(self) -> None:
+        node, _ = self.simplify_worklist.popitem()
+        self.select_stack.append(node)
+        self.on_stack.add(node)
+        for neighbor in self.adjacent(node):
+            self.decrement_degree(neighbor)
+
+    def add_work_list(self, node) -> None:
+        if not self.move_related(node) and self.degree[node] < self.k:
+            self.freeze_worklist.pop(node, None)
+            self.simplify_worklist[node] = None
+
+    def briggs(self, u, v) -> bool:
+        # Conservative: the merged node has fewer than k neighbors of significant degree
+        neighbors = set(self.adjacent(u)) | set(self.adjacent(v))
+        return sum(1 for neighbor in neighbors if self.degree[neighbor] >= self.k) < self.k
+
+    def george(self, u, v) -> bool:
+        # Every significant neighbor of v already interferes with u
+        return all(self.degree[t] < self.k or self.graph.contains_edge(t, u) for t in self.adjacent(v))
+
+    def coalesce(self) -> None:
+        move, _ = self.worklist_moves.popitem()
+        x, y = self.moves[move]
+        u = self.get_alias(y)
+        v = self.get_alias(x)
+
+        if u == v:
+            self.add_work_list(u)
+        elif self.graph.contains_edge(u, v):
+            self.add_work_list(u)
+            self.add_work_list(v)
+        elif self.george(u, v) or self.briggs(u, v):
+            self.combine(u, v)
+            self.add_work_list(u)
+        else:
+            self.active_moves.add(move)
+
+    def combine(self, u, v) -> None:
+        if v in self.freeze_worklist:
+            del self.freeze_worklist[v]
+        else:
+            self.spill_worklist.pop(v, None)
+        self.alias[v] = u
+        self.move_list[u] |= self.move_list[v]
+        self.enable_moves([v])
+        self.merges += 1
+
+        v_neighbors = self.adjacent(v)
+        new_neighbors = [t for t in v_neighbors if not self.graph.contains_edge(t, u)]
+        self.graph.rename_node(v, u)
+        self.cost[u] = self.cost.get(u, 0) + self.cost.get(v, 0)
+        del self.degree[v]
+
+        self.degree[u] += len(new_neighbors)
+        for t in new_neighbors:
+            self.degree[t] += 1
+        for t in v_neighbors:
+            self.decrement_degree(t)
+
+        if self.degree[u] >= self.k and u in self.freeze_worklist:
+            del self.freeze_worklist[u]
+            self._add_spill(u)
+        elif u in self.spill_worklist:
+            # Its cost changed
+            self._add_spill(u)
+
+    def freeze(self) -> None:
+        node, _ = self.freeze_worklist.popitem()
+        self.simplify_worklist[node] = None
+        self.freeze_moves(node)
+
+    def freeze_moves(self, u) -> None:
+        for move in self.node_moves(u):
+            x, y = self.moves[move]
+            v = self.get_alias(x) if self.get_alias(y) == self.get_alias(u) else self.get_alias(y)
+            self.active_moves.discard(move)
+            self.worklist_moves.pop(move, None)
+            if not self.move_related(v) and self.degree[v] < self.k and v in self.freeze_worklist:
+                del self.freeze_worklist[v]
+                self.simplify_worklist[v] = None
+
+    def select_spill(self) -> None:
+        while True:
+            cost, _, node = heapq.heappop(self._spill_heap)
+            if node in self.spill_worklist and cost == self.cost.get(node, 0):
+                break
+        del self.spill_worklist[node]
+        self.simplify_worklist[node] = None
+        self.freeze_moves(node)
+        self.potential_spills += 1
+
+    def run(self) -> None:
+        while True:
+            if self.simplify_worklist:
+                self.simplify()
+            elif self.worklist_moves:
+                self.coalesce()
+            elif self.freeze_worklist:
+                self.freeze()
+            elif self.spill_worklist:
+                self.select_spill()
+            else:
+                break
+
+    def assign_colors(self, colors: List[str], rng: Random) -> Tuple[Dict[str, str], Set[str]]:
+        coloring = {}
+        spilled = set()
+        while self.select_stack:
+            node = self.select_stack.pop()
+            neighbor_colors = {coloring[neighbor] for neighbor in self.graph.neighbors(node) if neighbor in coloring}
+            available = [color for color in colors if color not in neighbor_colors]
+            if available:
+                coloring[node] = rng.choice(available)
+            else:
+                spilled.add(node)
+        return coloring, spilled
+
+
+def iterated_register_coalescing(il: IntermediateLanguage,
+                                 graph: Graph,
+                                 colors: List[str],
+                                 cost: Dict[str, float],
+                                 stats: Optional[AllocationStats] = None,
+                                 seed: Optional[int] = None,
+                                 spilled: Collection[str] = ()) -> Tuple[Optional[Dict[str, str]], Set[str]]:
+    """
+    Colors the interference graph of ``il`` with George and Appel's iterated register coalescing.
+
+    Unlike ``coalesce_nodes``, copies are only coalesced when the merged node is still simplifiable: when every
+    significant neighbor of one side already interferes with the other (George) or the merged node has fewer than
+    ``len(colors)`` significant neighbors (Briggs). Simplify, coalesce, freeze and potential spill selection are
+    interleaved through worklists and select colors optimistically.
+
+    The graph is coalesced in place. On success the IL is rewritten to the coalesced register names; when nodes must
+    be spilled the IL is left untouched and the graph should be rebuilt after inserting spill code.
+
+    :param cost: Estimated cost of spilling each register, the cheapest is chosen as a potential spill
+    :param seed: Seed for the color choices, as in ``color_graph``
+    :param spilled: Registers created by spill code, whose copies are not coalesced as in ``coalesce_nodes``, like
+        those of the registers reloaded or spilled in the IL
+    :return: The coloring, or None if nodes must be spilled, and the registers of the IL to spill
+    """
+    fixed = _spill_code_registers(il, spilled)
+    moves = [(instruction.dec[0].reg, instruction.use[0].reg)
+             for instruction in il.instructions
+             if instruction.opcode == 'copy' and len(instruction.dec) != 0 and len(instruction.use) != 0 and
+             instruction.dec[0].reg != instruction.use[0].reg and
+             instruction.dec[0].reg not in fixed and instruction.use[0].reg not in fixed]
+
+    nodes = il.registers()
+    if seed is not None:
+        nodes = sorted(nodes)
+    engine = _IteratedCoalescing(graph, nodes, moves, len(colors), cost)
+    engine.run()
+    coloring, spilled = engine.assign_colors(colors, Random(seed))
+
+    if stats is not None:
+        stats.coalesce_iterations += engine.merges
+        stats.simplify_steps += len(coloring) + len(spilled)
+        stats.spill_candidates += engine.potential_spills
+
+    if spilled:
+        # Spilling a coalesced node spills every register merged into it
+        return None, {reg for reg in engine.degree.keys() | engine.alias.keys() if engine.get_alias(reg) in spilled}
+
+    mapping = {reg: engine.get_alias(reg) for reg in engine.alias}
+    if mapping:
+        il.rewrite_il(mapping)
+    return coloring, set()
+
+
+def _cardinality_search(graph: Graph, nodes: Collection[str]):
+    """
+    Yields the nodes in maximum cardinality search order, each with its already visited neighbors.
+    """
+    weight = dict.fromkeys(nodes, 0)
+    buckets = [dict.fromkeys(weight)]
+    top = 0
+
+    while True:
+        while top >= 0 and not buckets[top]:
+            top -= 1
+        if top < 0:
+            return
+
+        node, _ = buckets[top].popitem()
+        del weight[node]
+
+        visited = []
+        for neighbor in graph.neighbors(node):
+            neighbor_weight = weight.get(neighbor)
+            if neighbor_weight is None:
+                visited.append(neighbor)
+            else:
+                del buckets[neighbor_weight][neighbor]
+                neighbor_weight += 1
+                weight[neighbor] = neighbor_weight
+                if neighbor_weight == len(buckets):
+                    buckets.append({})
+                buckets[neighbor_weight][neighbor] = None
+                if neighbor_weight > top:
+                    top = neighbor_weight
+
+        yield node, visited
+
+
+def maximum_cardinality_search(graph: Graph, nodes: Collection[str]) -> Tuple[List[str], int]:
+    """
+    Orders ``nodes`` by maximum cardinality search: each step visits the node with the most already visited
+    neighbors. Nodes are kept in buckets by that count, so the search is O(V + E).
+
+    When the graph is chordal the reverse of the order is a perfect elimination order, and the visited neighbors of
+    each node together with the node form a clique.
+
+    :return: The visit order and the size of the largest such clique, which is the maximum clique of a chordal graph
+    """
+    order = []
+    clique = 0
+    members = set(nodes)
+
+    for node, visited in _cardinality_search(graph, members):
+        order.append(node)
+        clique = max(clique, 1 + sum(1 for neighbor in visited if neighbor in members))
+
+    return order, clique
+
+
+def is_perfect_elimination_order(graph: Graph, order: List[str]) -> bool:
+    """
+    Checks that the reverse of ``order`` is a perfect elimination order, that is that the neighbors of every node
+    that come before it in ``order`` form a clique.
+
+    Following Tarjan and Yannakakis, only the edges from the latest of those neighbors to the others are tested, so
+    the check is O(V + E).
+    """
+    position = {node: index for index, node in enumerate(order)}
+
+    for index, node in enumerate(order):
+        earlier = [neighbor for neighbor in graph.neighbors(node) if position.get(neighbor, index) < index]
+        if not _earlier_neighbors_form_clique(graph, earlier, position):
+            return False
+
+    return True
+
+
+def _earlier_neighbors_form_clique(graph: Graph, earlier: List[str], position: Dict[str, int]) -> bool:
+    if len(earlier) < 2:
+        return True
+
+    parent = max(earlier, key=position.__getitem__)
+    contains_edge = graph.contains_edge
+    return all(neighbor == parent or contains_edge(parent, neighbor) for neighbor in earlier)
+
+
+def color_graph_chordal(g: Graph,
+                        n: Collection[str],
+                        colors: List[str],
+                        stats: Optional[AllocationStats] = None) -> Tuple[Optional[Dict[str, str]], Optional[int]]:
+    """
+    Colors a chordal graph optimally in O(V + E), as the interference graphs of SSA form are.
+
+    Nodes are colored greedily in maximum cardinality search order, which uses exactly as many colors as the largest
+    clique. The search, the perfect elimination order check and the coloring share one pass over the neighbors of
+    each node. The clique size is the register pressure, so when it exceeds ``len(colors)`` the caller can go
+    straight to choosing spills.
+
+    :return: The coloring, or None if the maximum clique needs more colors, and the maximum clique size. Both are
+        None when the graph is not chordal, in which case another coloring method must be used.
+    """
+    members = set(n)
+    position = {}
+    coloring = {}
+    clique = 0
+
+    for node, visited in _cardinality_search(g, members):
+        earlier = [neighbor for neighbor in visited if neighbor in members]
+        if not _earlier_neighbors_form_clique(g, earlier, position):
+            return None, None
+
+        position[node] = len(position)
+        clique = max(clique, len(earlier) + 1)
+        if clique <= len(colors):
+            neighbor_colors = {coloring[neighbor] for neighbor in earlier}
+            coloring[node] = next(color for color in colors if color not in neighbor_colors)
+
+    if stats is not None:
+        stats.max_clique = clique
+        stats.simplify_steps += len(position)
+    if clique > len(colors):
+        return None, clique
+    return coloring, clique
+
+
+class LiveInterval:
+    """
+    The live range of one register over the instruction order, as sorted, disjoint ``[start, end]`` ranges.
+
+    Position ``2 * i`` is where the registers whose last use is instruction ``i`` die and ``2 * i + 1`` is where the
+    registers it defines become live, so a register defined by the instruction that kills another does not overlap
+    it. A register is only live in the blocks it is live in, so the gaps between ranges are holes another register can
+    use.
+    """
+
+    __slots__ = ('reg', 'starts', 'ends')
+
+    def __init__(self, reg: str):
+        self.reg = reg
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+
+    def __repr__(self):
+        return 'LiveInterval({!r}, {})'.format(self.reg, list(zip(self.starts, self.ends)))
+
+    @property
+    def start(self) -> int:
+        return self.starts[0]
+
+    @property
+    def end(self) -> int:
+        return self.ends[-1]
+
+    def add_range(self, start: int, end: int) -> None:
+        if self.ends and start <= self.ends[-1] + 1:
+            self.ends[-1] = max(self.ends[-1], end)
+        else:
+            self.starts.append(start)
+            self.ends.append(end)
+
+
+def live_intervals(il: IntermediateLanguage) -> Dict[str, LiveInterval]:
+    """
+    Computes the live interval of every register in one pass over the IL, with the liveness rules of
+    ``add_interference``.
+    """
+    intervals = {}
+    liveness = {}
+    # The position each live register became live at
+    opened = {}
+
+    def add_range(reg: str, start: int, end: int) -> None:
+        interval = intervals.get(reg)
+        if interval is None:
+            interval = intervals[reg] = LiveInterval(reg)
+        interval.add_range(start, end)
+
+    position = 0
+    for instruction in il.instructions:
+        if instruction.opcode == 'bb':
+            # Nothing is live across a block boundary unless the next block declares it
+            for reg, start in opened.items():
+                add_range(reg, start, position)
+            opened = {}
+            liveness = {}
+        else:
+            for use in instruction.use:
+                if use.dead:
+                    reg = use.reg
+                    count = liveness[reg] - 1
+                    if count == 0:
+                        del liveness[reg]
+                        add_range(reg, opened.pop(reg), position)
+                    else:
+                        liveness[reg] = count
+
+        position += 1
+        for dec in instruction.dec:
+            reg = dec.reg
+            count = liveness.get(reg, 0)
+            if dec.dead:
+                if count == 0:
+                    add_range(reg, position, position)
+            else:
+                if count == 0:
+                    opened[reg] = position
+                liveness[reg] = count + 1
+        position += 1
+
+    for reg, start in opened.items():
+        add_range(reg, start, position)
+
+    return intervals
+
+
+def linear_scan(il: IntermediateLanguage,
+                colors: List[str],
+                cost: Dict[str, float],
+                stats: Optional[AllocationStats] = None) -> Tuple[Optional[Dict[str, str]], Set[str]]:
+    """
+    Allocates registers by linear scan over the live intervals of ``il``, without building an interference graph.
+
+    Intervals are visited in order of their start and each gets the first color whose holders it does not intersect.
+    The ranges held by each color are kept sorted, so checking a color costs a binary search per range of the
+    interval and intervals with lifetime holes share a color with whatever fits in the holes. When every color is
+    taken, either the current interval or the intervals holding the cheapest color are spilled, whichever has the
+    lower spill weight. As with ``decide_spills`` the weight is the spill cost, here divided by the length of the
+    interval so long, rarely used ranges are spilled first.
+
+    Two intervals intersect whenever both registers are live at one point, which includes registers that are only
+    live into the same block and never interfere in ``build_graph``, so linear scan may spill where coloring would
+    not.
+
+    :param cost: Estimated cost of spilling each register
+    :return: The coloring, or None if registers must be spilled, and the registers to spill, which
+        ``insert_spill_code`` accepts
+    """
+    intervals = sorted(live_intervals(il).values(), key=lambda interval: interval.start)
+    coloring = {}
+    spilled = set()
+    # The disjoint ranges held by each color as sorted starts, ends and owning intervals
+    held = {color: ([], [], []) for color in colors}
+
+    def weight(interval: LiveInterval) -> float:
+        return cost.get(interval.reg, 0) / (interval.end - interval.start + 1)
+
+    def holders(color: str, interval: LiveInterval, first: bool) -> List[LiveInterval]:
+        starts, ends, owners = held[color]
+        found = []
+        for start, end in zip(interval.starts, interval.ends):
+            index = bisect_left(ends, start)
+            while index < len(starts) and starts[index] <= end:
+                found.append(owners[index])
+                if first:
+                    return found
+                index += 1
+        return found
+
+    for current in intervals:
+        free = None
+        if len(current.starts) == 1:
+            # Most intervals are a single range, a color is free when no held range overlaps it
+            start = current.starts[0]
+            end = current.ends[0]
+            for color in colors:
+                starts, ends, _ = held[color]
+                index = bisect_left(ends, start)
+                if index == len(starts) or starts[index] > end:
+                    free = color
+                    break
+        else:
+            free = next((color for color in colors if not holders(color, current, True)), None)
+
+        if free is None and colors:
+            evict = {color: dict.fromkeys(holders(color, current, False)) for color in colors}
+            color_weight = {color: sum(weight(interval) for interval in owners) for color, owners in evict.items()}
+            color = min(colors, key=color_weight.__getitem__)
+            if color_weight[color] < weight(current):
+                starts, ends, owners = held[color]
+                for interval in evict[color]:
+                    for start in interval.starts:
+                        index = bisect_left(starts, start)
+                        del starts[index], ends[index], owners[index]
+                    del coloring[interval.reg]
+                    spilled.add(interval.reg)
+                free = color
+
+        if free is None:
+            spilled.add(current.reg)
+            continue
+
+        coloring[current.reg] = free
+        starts, ends, owners = held[free]
+        for start, end in zip(current.starts, current.ends):
+            index = bisect_left(starts, start)
+            starts.insert(index, start)
+            ends.insert(index, end)
+            owners.insert(index, current)
+
+    if stats is not None:
+        stats.simplify_steps += len(intervals)
+        stats.spill_candidates += len(spilled)
+
+    if spilled:
+        return None, spilled
+    return coloring, set()
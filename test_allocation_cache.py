@@ -0,0 +1,76 @@
+import os
+
+import benchmarks
+from allocation_cache import AllocationCache, il_hash
+
+COLORS = ['c{}'.format(i) for i in range(4)]
+
+
+def as_tuples(instructions):
+    return [(
+        instruction.opcode,
+        instruction.frequency,
+        [(dec.reg, dec.dead) for dec in instruction.dec],
+        [(use.reg, use.dead) for use in instruction.use],
+        instruction.rematerializable
+    ) for instruction in instructions]
+
+
+def test_hit_returns_stored_result():
+    cache = AllocationCache()
+    il = benchmarks.straight_line_il(100)
+    graph, coloring = cache.allocate(il, COLORS, seed=1)
+
+    cached_il = benchmarks.straight_line_il(100)
+    cached_graph, cached_coloring = cache.allocate(cached_il, COLORS, seed=1)
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert graph is not None and cached_graph is None
+    assert cached_coloring == coloring
+    assert as_tuples(cached_il.instructions) == as_tuples(il.instructions)
+
+
+def test_key_covers_il_colors_and_options():
+    il = benchmarks.straight_line_il(50)
+    key = il_hash(il, COLORS, seed=1)
+
+    assert il_hash(benchmarks.straight_line_il(50), COLORS, seed=1, stats=None) == key
+    # Options passed with their default values are the same allocation
+    assert il_hash(il, COLORS, seed=1, optimistic=False, spill_mode='everywhere') == key
+    assert il_hash(benchmarks.straight_line_il(50, seed=1), COLORS, seed=1) != key
+    assert il_hash(il, COLORS[:3], seed=1) != key
+    assert il_hash(il, COLORS, seed=2) != key
+    assert il_hash(il, COLORS, seed=1, optimistic=True) != key
+
+
+def test_memory_tier_is_lru():
+    cache = AllocationCache(capacity=2)
+    ils = [benchmarks.straight_line_il(20, seed) for seed in range(3)]
+    keys = [il_hash(il, COLORS) for il in ils]
+
+    cache.allocate(benchmarks.straight_line_il(20, 0), COLORS)
+    cache.allocate(benchmarks.straight_line_il(20, 1), COLORS)
+    assert cache.get(keys[0]) is not None
+    cache.allocate(benchmarks.straight_line_il(20, 2), COLORS)
+
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
+
+
+def test_disk_tier_is_shared_and_bounded(tmp_path):
+    directory = str(tmp_path / 'cache')
+    writer = AllocationCache(directory=directory)
+    _, coloring = writer.allocate(benchmarks.straight_line_il(100), COLORS, seed=3)
+
+    reader = AllocationCache(directory=directory)
+    _, cached_coloring = reader.allocate(benchmarks.straight_line_il(100), COLORS, seed=3)
+    assert reader.hits == 1
+    assert cached_coloring == coloring
+
+    entry_size = sum(entry.stat().st_size for entry in os.scandir(directory))
+    bounded = AllocationCache(directory=directory, max_bytes=2 * entry_size)
+    for seed in range(5):
+        bounded.allocate(benchmarks.straight_line_il(100, seed), COLORS, seed=3)
+    assert sum(entry.stat().st_size for entry in os.scandir(directory)) <= 2 * entry_size
+    assert not [name for name in os.listdir(directory) if name.endswith('.tmp')]
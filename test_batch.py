@@ -0,0 +1,77 @@
+import os
+
+import batch
+from register_allocation import Dec, Use, Instruction, IntermediateLanguage
+
+
+def basic_il():
+    return IntermediateLanguage([
+        Instruction(
+            'bb',
+            [Dec('a', False)],
+            []),
+        Instruction(
+            'b = a + 2',
+            [Dec('b', False)],
+            [Use('a', False)]
+        ),
+        Instruction(
+            'return b * a',
+            [],
+            [Use('a', True), Use('b', True)]
+        )
+    ])
+
+
+def broken_il():
+    # 'x' is used without ever being live
+    return IntermediateLanguage([
+        Instruction(
+            'bb',
+            [],
+            []),
+        Instruction(
+            'return x',
+            [],
+            [Use('x', True)]
+        )
+    ])
+
+
+def crash_on_boom(graph, coloring, title):
+    if 'boom' in graph.nodes():
+        os._exit(1)
+
+
+def test_allocate_batch_ordered():
+    ils = [basic_il(), broken_il(), basic_il()]
+
+    results = list(batch.allocate_batch(ils, ['red', 'blue'], processes=2, ordered=True))
+
+    assert [result.index for result in results] == [0, 1, 2]
+    assert results[0].ok and results[2].ok
+    assert results[0].coloring['a'] != results[0].coloring['b']
+    assert not results[1].ok
+    assert 'KeyError' in results[1].error
+
+
+def test_allocate_batch_unordered():
+    ils = [basic_il() for _ in range(4)]
+
+    results = list(batch.allocate_batch(ils, ['red', 'blue'], processes=2))
+
+    assert sorted(result.index for result in results) == [0, 1, 2, 3]
+    assert all(result.ok for result in results)
+
+
+def test_allocate_batch_survives_crashed_worker():
+    ils = [basic_il() for _ in range(10)]
+    ils[1].rewrite_il({'a': 'boom'})
+
+    # The hook takes down the worker allocating the function with a 'boom' register
+    results = list(batch.allocate_batch(ils, ['red', 'blue'], processes=2, ordered=True, visualize=crash_on_boom))
+
+    assert [result.index for result in results] == list(range(10))
+    assert not results[1].ok
+    assert 'died' in results[1].error
+    assert all(result.ok for index, result in enumerate(results) if index != 1)
@@ -0,0 +1,29 @@
+import benchmarks
+import register_allocation
+
+
+def test_generators_produce_valid_il():
+    for name, generator in benchmarks.GENERATORS.items():
+        il = generator(200, 1)
+
+        assert len(il.registers()) >= 200, name
+        graph = register_allocation.build_graph(il)
+        assert all(graph.degree(node) > 0 for node in graph.nodes()), name
+
+
+def test_run_case_reports_every_phase():
+    record = benchmarks.run_case('many_block', 50)
+
+    assert sorted(record['seconds']) == sorted(benchmarks.PHASES)
+    assert sorted(record['peak_bytes']) == sorted(benchmarks.PHASES)
+    assert benchmarks.compare([record], [record])
+
+
+def test_run_allocators_side_by_side():
+    results = benchmarks.run_allocators('copy_heavy', 200, colors=4)
+
+    assert sorted(results) == sorted(benchmarks.ALLOCATORS)
+    assert all(result['colored'] for result in results.values())
+    # Conservative coalescing never needs more spill code than coalescing every copy here
+    assert (results['irc']['reloads'] + results['irc']['spills'] <=
+            results['chaitin']['reloads'] + results['chaitin']['spills'])
@@ -0,0 +1,101 @@
+import pytest
+
+import graph_format
+import register_allocation
+from register_allocation import Dec, Use, Instruction, IntermediateLanguage, Graph, BitMatrixAdjacency
+
+
+def example_graph():
+    graph = Graph()
+    for x, y in [('a', 'b'), ('a', 'c'), ('b', 'c'), ('c', 'd'), ('d', 'odd\tname')]:
+        graph.add_edge(x, y)
+    return graph
+
+
+def edge_set(graph):
+    return {frozenset(edge) for edge in graph.edges()}
+
+
+def test_csr_round_trip(tmp_path):
+    graph = example_graph()
+    coloring = {'a': 'red', 'b': 'blue', 'd': 'red', 'odd\tname': 'blue', 'isolated': 'red'}
+    path = str(tmp_path / 'example.csr')
+
+    graph_format.write_csr(graph, path, coloring, {'c'})
+
+    loaded, loaded_coloring, spilled = graph_format.read_csr(path, BitMatrixAdjacency)
+    assert edge_set(loaded) == edge_set(graph)
+    assert set(loaded.nodes()) == set(graph.nodes()) | {'isolated'}
+    assert loaded_coloring == coloring
+    assert spilled == {'c'}
+
+
+def test_csr_graph_queries_mapped_file(tmp_path):
+    graph = example_graph()
+    path = str(tmp_path / 'example.csr')
+    graph_format.write_csr(graph, path)
+
+    with graph_format.CSRGraph(path) as csr:
+        assert len(csr) == 5
+        assert csr.edge_count() == graph.edge_count()
+        assert edge_set(csr) == edge_set(graph)
+        assert sorted(csr.neighbors('c')) == ['a', 'b', 'd']
+        assert csr.degree('c') == 3
+        assert csr.degree('missing') == 0
+        assert csr.contains_edge('d', 'odd\tname')
+        assert not csr.contains_edge('a', 'd')
+        assert csr.coloring == {}
+        assert csr.spilled == set()
+
+
+def test_edge_list_round_trip(tmp_path):
+    graph = example_graph()
+    coloring = {'a': 'red', 'b': 'blue', 'isolated': 'blue'}
+    path = str(tmp_path / 'example.edges')
+
+    graph_format.write_edge_list(graph, path, coloring, {'c', 'd'})
+
+    loaded, loaded_coloring, spilled = graph_format.read_edge_list(path)
+    assert edge_set(loaded) == edge_set(graph)
+    assert loaded_coloring == coloring
+    assert spilled == {'c', 'd'}
+
+
+def test_edge_list_keeps_labels_starting_with_hash(tmp_path):
+    graph = Graph()
+    graph.add_edge('#a', 'b')
+    coloring = {'#x': 'red', 'b': '#blue'}
+    path = str(tmp_path / 'hash.edges')
+
+    # Records starting with # would be read back as comments if the labels were not escaped
+    graph_format.write_edge_list(graph, path, coloring)
+
+    loaded, loaded_coloring, spilled = graph_format.read_edge_list(path)
+    assert edge_set(loaded) == {frozenset(('#a', 'b'))}
+    assert loaded_coloring == coloring
+    assert spilled == set()
+
+
+def test_edge_list_rejects_empty_color_names(tmp_path):
+    path = tmp_path / 'empty.edges'
+
+    # An empty color field marks an uncolored node
+    with pytest.raises(ValueError):
+        graph_format.write_edge_list(example_graph(), str(path), {'a': ''})
+    assert not path.exists()
+
+
+def test_allocation_result_survives_round_trip(tmp_path):
+    il = IntermediateLanguage([
+        Instruction('bb', [Dec('a', False)], []),
+        Instruction('b := a + 1', [Dec('b', False)], [Use('a', False)]),
+        Instruction('ret', [], [Use('a', True), Use('b', True)])
+    ])
+    graph, coloring = register_allocation.allocate(il, ['red', 'blue'])
+    path = str(tmp_path / 'allocated.csr')
+
+    graph_format.write_csr(graph, path, coloring)
+
+    with graph_format.CSRGraph(path) as csr:
+        assert csr.coloring == coloring
+        assert all(csr.coloring[x] != csr.coloring[y] for x, y in csr.edges())
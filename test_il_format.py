@@ -0,0 +1,115 @@
+import pytest
+
+import il_format
+import register_allocation
+from register_allocation import Dec, Use, Instruction, IntermediateLanguage
+
+
+def example_il():
+    return IntermediateLanguage([
+        Instruction(
+            'bb',
+            [Dec('b', False), Dec('c', False), Dec('f', False)],
+            [],
+            frequency=1
+        ),
+        Instruction(
+            'a := b + c',
+            [Dec('a', False)],
+            [Use('b', True), Use('c', False)]
+        ),
+        Instruction(
+            'd := -a',
+            [Dec('d', False)],
+            [Use('a', True)],
+            rematerializable=True
+        ),
+        Instruction(
+            'e := d + f',
+            [Dec('e', False)],
+            [Use('d', False), Use('f', False)]
+        ),
+        Instruction(
+            'bb',
+            [Dec('c', False), Dec('e', False)],
+            [],
+            frequency=0.75
+        ),
+        Instruction(
+            'odd\tname',
+            [Dec('!x y', False)],
+            [Use('e', True)]
+        ),
+        Instruction(
+            'ret',
+            [],
+            [Use('c', True), Use('!x y', True)]
+        )
+    ])
+
+
+def as_tuples(instructions):
+    return [(
+        instruction.opcode,
+        instruction.frequency,
+        [(dec.reg, dec.dead) for dec in instruction.dec],
+        [(use.reg, use.dead) for use in instruction.use],
+        instruction.rematerializable
+    ) for instruction in instructions]
+
+
+def test_text_round_trip(tmp_path):
+    il = example_il()
+    # Would read as a comment line if the leading # were not escaped
+    il.instructions.insert(1, Instruction('#op', [Dec('#x', False)], [Use('b', False)]))
+    il.instructions[-1].use.append(Use('#x', True))
+    path = str(tmp_path / 'example.il')
+
+    il_format.write_text(il, path)
+
+    assert as_tuples(il_format.read_text(path)) == as_tuples(il.instructions)
+    assert as_tuples(il_format.load(path).instructions) == as_tuples(il.instructions)
+
+
+def test_text_requires_header(tmp_path):
+    path = tmp_path / 'headerless.il'
+    path.write_text('\nbb\t1\ta b\t\n', encoding='utf-8')
+
+    with pytest.raises(ValueError):
+        list(il_format.read_text(str(path)))
+
+
+def test_binary_round_trip(tmp_path):
+    il = example_il()
+    il.instructions[1].frequency = 2.0
+    path = str(tmp_path / 'example.ilb')
+
+    il_format.write_binary(il, path)
+
+    assert as_tuples(il_format.read_binary(path)) == as_tuples(il.instructions)
+    assert as_tuples(il_format.load(path).instructions) == as_tuples(il.instructions)
+    # Integer and float frequencies keep their types
+    assert ([type(instruction.frequency) for instruction in il_format.read_binary(path)] ==
+            [type(instruction.frequency) for instruction in il.instructions])
+
+
+def test_streamed_passes_match_in_memory(tmp_path):
+    il = example_il()
+    path = str(tmp_path / 'example.ilb')
+    il_format.write_binary(il, path)
+    streamed = il_format.ILFile(path)
+
+    assert streamed.registers() == il.registers()
+    assert register_allocation.estimate_spill_costs(streamed) == register_allocation.estimate_spill_costs(il)
+    assert ({frozenset(edge) for edge in register_allocation.build_graph(streamed).edges()} ==
+            {frozenset(edge) for edge in register_allocation.build_graph(il).edges()})
+
+
+def test_write_after_spilling(tmp_path):
+    il = example_il()
+    register_allocation.insert_spill_code(il, {'c'})
+    path = str(tmp_path / 'spilled.il')
+
+    il_format.write_text(il, path)
+
+    assert [instruction.opcode for instruction in il_format.read_text(path)].count('reload') == 2
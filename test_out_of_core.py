@@ -0,0 +1,58 @@
+import benchmarks
+import il_format
+import out_of_core
+import register_allocation
+
+
+def edge_set(graph):
+    return {frozenset(edge) for edge in graph.edges()}
+
+
+def test_build_graph_out_of_core(tmp_path):
+    il = benchmarks.many_block_il(300)
+    il_path = str(tmp_path / 'function.ilb')
+    il_format.write_binary(il, il_path)
+
+    # A tiny budget spreads the edges over many runs
+    with out_of_core.build_graph_out_of_core(il_format.ILFile(il_path), str(tmp_path / 'graph.csr'),
+                                             memory_budget=4096, directory=str(tmp_path)) as csr:
+        assert edge_set(csr) == edge_set(register_allocation.build_graph(il))
+        assert set(csr.nodes()) == il.registers()
+
+    # Only the graph is left behind
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['function.ilb', 'graph.csr']
+
+
+def test_color_and_spill_csr(tmp_path):
+    colors = ['c{}'.format(i) for i in range(8)]
+
+    il = benchmarks.straight_line_il(100)
+    with out_of_core.build_graph_out_of_core(il, str(tmp_path / 'light.csr')) as csr:
+        coloring = out_of_core.color_csr(csr, colors)
+    assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(il).edges())
+
+    il = benchmarks.high_pressure_il(300)
+    cost = register_allocation.estimate_spill_costs(il)
+    with out_of_core.build_graph_out_of_core(il, str(tmp_path / 'heavy.csr'), memory_budget=4096) as csr:
+        assert out_of_core.color_csr(csr, colors) is None
+        spilled = out_of_core.decide_spills_csr(csr, len(colors), cost)
+    assert spilled == register_allocation.decide_spills(il, register_allocation.build_graph(il), colors, cost)
+
+
+def test_allocate_out_of_core(tmp_path):
+    colors = ['c{}'.format(i) for i in range(8)]
+    il = benchmarks.many_block_il(300)
+    spilled_before = set()
+
+    for _ in range(register_allocation.MAX_SPILL_ROUNDS):
+        coloring, spilled = out_of_core.allocate_out_of_core(il, colors, memory_budget=4096,
+                                                             directory=str(tmp_path), spilled_before=spilled_before)
+        if coloring is not None:
+            break
+        register_allocation.insert_spill_code(il, spilled)
+        spilled_before |= spilled
+
+    assert coloring is not None
+    assert spilled_before
+    assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(il).edges())
+    assert list(tmp_path.iterdir()) == []
@@ -1,3 +1,8 @@
+import os
+import subprocess
+import sys
+
+import benchmarks
 import register_allocation
 from register_allocation import Dec, Use, Instruction, IntermediateLanguage, Graph
 
@@ -357,3 +362,970 @@ def test_color_il_with_spills_and_frequency():
     graph, coloring = register_allocation.run(il, colors)
 
     assert coloring is not None
+
+
+def test_graph_backends():
+    for backend in [register_allocation.SetAdjacency, register_allocation.BitMatrixAdjacency]:
+        graph = Graph(backend)
+        graph.add_edge('a', 'b')
+        graph.add_edge('b', 'a')
+        graph.add_edge('a', 'c')
+        graph.add_edge('c', 'd')
+
+        assert graph.contains_edge('b', 'a')
+        assert not graph.contains_edge('b', 'c')
+        assert graph.degree('a') == 2
+        assert sorted(graph.neighbors('a')) == ['b', 'c']
+
+        graph.rename_node('d', 'b')
+        assert graph.contains_edge('b', 'c')
+        assert not graph.contains_edge('d', 'c')
+        assert 'd' not in graph.nodes()
+
+        graph.remove_node('a')
+        assert not graph.contains_edge('b', 'a')
+        assert sorted(graph.neighbors('b')) == ['c']
+        assert sorted(tuple(sorted(edge)) for edge in graph.edges()) == [('b', 'c')]
+
+
+def test_build_graph_backends_agree():
+    il = IntermediateLanguage([
+        Instruction(
+            'bb',
+            [Dec('b', False), Dec('c', False), Dec('f', False)],
+            []),
+        Instruction(
+            'a := b + c',
+            [Dec('a', False)],
+            [Use('b', True), Use('c', False)]
+        ),
+        Instruction(
+            'd := a',
+            [Dec('d', False)],
+            [Use('a', True)]
+        ),
+        Instruction(
+            'e := d + f',
+            [Dec('e', False)],
+            [Use('d', False), Use('f', False)]
+        )
+    ])
+
+    set_graph = register_allocation.build_graph(il)
+    matrix_graph = register_allocation.build_graph(il, register_allocation.BitMatrixAdjacency)
+
+    assert ({frozenset(edge) for edge in set_graph.edges()} ==
+            {frozenset(edge) for edge in matrix_graph.edges()})
+
+
+def test_color_graph_large_path():
+    graph = Graph()
+    nodes = ['r{}'.format(i) for i in range(5000)]
+    for x, y in zip(nodes, nodes[1:]):
+        graph.add_edge(x, y)
+
+    coloring = register_allocation.color_graph(graph, nodes, ['red', 'blue'])
+
+    assert coloring is not None
+    assert len(coloring) == len(nodes)
+    assert all(coloring[x] != coloring[y] for x, y in graph.edges())
+
+
+def test_color_graph_uncolorable():
+    graph = Graph()
+    graph.add_edge('a', 'b')
+    graph.add_edge('b', 'c')
+    graph.add_edge('c', 'a')
+
+    assert register_allocation.color_graph(graph, ['a', 'b', 'c'], ['red', 'blue']) is None
+
+
+def test_decide_spills():
+    il = IntermediateLanguage([
+        Instruction(
+            'bb',
+            [Dec('b', False), Dec('c', False), Dec('f', False)],
+            [],
+            frequency=1
+        ),
+        Instruction(
+            'a := b + c',
+            [Dec('a', False)],
+            [Use('b', True), Use('c', False)]
+        ),
+        Instruction(
+            'd := -a',
+            [Dec('d', False)],
+            [Use('a', True)]
+        ),
+        Instruction(
+            'e := d + f',
+            [Dec('e', False)],
+            [Use('d', False), Use('f', False)]
+        ),
+
+        Instruction(
+            'bb',
+            [Dec('c', False), Dec('e', False)],
+            [],
+            frequency=0.75
+        ),
+        Instruction(
+            'f := 2 + e',
+            [Dec('f', False)],
+            [Use('e', True)]
+        ),
+
+        Instruction(
+            'bb',
+            [Dec('c', False), Dec('d', False), Dec('e', False), Dec('f', False)],
+            [],
+            frequency=0.25
+        ),
+        Instruction(
+            'b := d + e',
+            [Dec('b', False)],
+            [Use('d', True), Use('e', False)]
+        ),
+        Instruction(
+            'e := e - 1',
+            [Dec('e', False)],
+            [Use('e', True)]
+        ),
+
+        Instruction(
+            'bb',
+            [Dec('c', False), Dec('f', False)],
+            [],
+            frequency=1
+        ),
+        Instruction(
+            'b := f + c',
+            [Dec('b', True)],
+            [Use('c', False), Use('f', False)]
+        ),
+    ])
+    colors = ['red', 'blue', 'yellow']
+
+    graph = register_allocation.build_graph(il)
+    cost = register_allocation.estimate_spill_costs(il)
+    spilled = register_allocation.decide_spills(il, graph, colors, cost)
+
+    assert spilled == {'c'}
+
+
+def test_degree_worklist():
+    graph = Graph()
+    graph.add_edge('a', 'b')
+    graph.add_edge('a', 'c')
+    graph.add_edge('b', 'c')
+    graph.add_edge('c', 'd')
+
+    worklist = register_allocation.DegreeWorklist(graph, ['a', 'b', 'c', 'd'], 2, {'a': 3, 'b': 1, 'c': 2, 'd': 4})
+
+    assert worklist.low_node() == 'd'
+    worklist.remove('d')
+    assert worklist.degree('c') == 2
+    assert worklist.low_node() is None
+    assert worklist.cheapest_node() == 'b'
+    worklist.remove('b')
+    assert worklist.cheapest_node() == 'c'
+    assert worklist.low_node() in {'a', 'c'}
+
+
+def test_coalesce_nodes_chain():
+    il = IntermediateLanguage([
+        Instruction(
+            'bb',
+            [Dec('a', False)],
+            [],
+            frequency=0.5
+        ),
+        Instruction(
+            'copy',
+            [Dec('b', False)],
+            [Use('a', True)]
+        ),
+        Instruction(
+            'copy',
+            [Dec('c', False)],
+            [Use('b', True)]
+        ),
+        Instruction(
+            'op1',
+            [Dec('d', False)],
+            [Use('c', False)],
+            frequency=2
+        ),
+        Instruction(
+            'ret',
+            [],
+            [Use('c', True), Use('d', True)]
+        )
+    ])
+
+    graph = register_allocation.build_graph(il)
+    merges = register_allocation.coalesce_nodes(il, graph)
+
+    assert merges == 2
+    assert il.registers() == {'a', 'd'}
+    assert graph.contains_edge('a', 'd')
+    assert [instruction.frequency for instruction in il.instructions] == [0.5, 1, 1, 2, 1]
+
+
+def test_allocate_is_headless():
+    script = '\n'.join([
+        'import sys',
+        'from register_allocation import Dec, Use, Instruction, IntermediateLanguage, allocate',
+        'il = IntermediateLanguage([',
+        '    Instruction("bb", [Dec("a", False)], []),',
+        '    Instruction("op1", [Dec("b", False)], [Use("a", True)]),',
+        '    Instruction("ret", [], [Use("b", True)]),',
+        '])',
+        'graph, coloring = allocate(il, ["red"])',
+        'assert coloring is not None',
+        'assert "matplotlib" not in sys.modules',
+        'assert "networkx" not in sys.modules',
+    ])
+
+    subprocess.run([sys.executable, '-c', script], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_compact_il_round_trip():
+    il = IntermediateLanguage([
+        Instruction(
+            'bb',
+            [Dec('a', False)],
+            [],
+            frequency=0.5
+        ),
+        Instruction(
+            'op1',
+            [Dec('b', False)],
+            [Use('a', False)],
+            rematerializable=True
+        ),
+        Instruction(
+            'ret',
+            [],
+            [Use('a', True), Use('b', True)]
+        )
+    ])
+
+    compact = register_allocation.CompactIntermediateLanguage.from_il(il)
+
+    assert len(compact) == 3
+    assert compact.registers() == il.registers()
+    assert register_allocation.estimate_spill_costs(compact) == register_allocation.estimate_spill_costs(il)
+    assert ({frozenset(edge) for edge in register_allocation.build_graph(compact).edges()} ==
+            {frozenset(edge) for edge in register_allocation.build_graph(il).edges()})
+
+    restored = compact.to_il()
+    for original, instruction in zip(il.instructions, restored.instructions):
+        assert instruction.opcode == original.opcode
+        assert instruction.frequency == original.frequency
+        assert instruction.rematerializable == original.rematerializable
+        assert [(dec.reg, dec.dead) for dec in instruction.dec] == [(dec.reg, dec.dead) for dec in original.dec]
+        assert [(use.reg, use.dead) for use in instruction.use] == [(use.reg, use.dead) for use in original.use]
+
+    # build_graph replays the arrays of the compact form without building instructions
+    il = benchmarks.many_block_il(200)
+    compact = register_allocation.CompactIntermediateLanguage.from_il(il)
+    live_in = [[dec.reg for dec in instruction.dec] for instruction in il.instructions if instruction.opcode == 'bb']
+    for backend in (register_allocation.SetAdjacency, register_allocation.BitMatrixAdjacency):
+        for blocks_live_in in (None, live_in):
+            graph = register_allocation.build_graph(compact, backend, blocks_live_in)
+            expected = register_allocation.build_graph(il, backend, blocks_live_in)
+            assert {frozenset(edge) for edge in graph.edges()} == {frozenset(edge) for edge in expected.edges()}
+
+
+def test_update_graph_after_spill():
+    il = IntermediateLanguage([
+        Instruction(
+            'bb',
+            [Dec('b', False), Dec('c', False), Dec('f', False)],
+            []),
+        Instruction(
+            'a := b + c',
+            [Dec('a', False)],
+            [Use('b', True), Use('c', False)]
+        ),
+        Instruction(
+            'd := -a',
+            [Dec('d', False)],
+            [Use('a', True)]
+        ),
+        Instruction(
+            'e := d + f',
+            [Dec('e', False)],
+            [Use('d', False), Use('f', False)]
+        ),
+        Instruction(
+            'bb',
+            [Dec('c', False), Dec('d', False), Dec('e', False), Dec('f', False)],
+            []),
+        Instruction(
+            'b := d + e',
+            [Dec('b', False)],
+            [Use('d', True), Use('e', False)]
+        ),
+        Instruction(
+            'e := e - 1',
+            [Dec('e', False)],
+            [Use('e', True)]
+        ),
+        Instruction(
+            'ret',
+            [],
+            [Use('b', True), Use('c', True), Use('e', True), Use('f', True)]
+        )
+    ])
+
+    set_graph = register_allocation.build_graph(il)
+    matrix_graph = register_allocation.build_graph(il, register_allocation.BitMatrixAdjacency)
+    register_allocation.insert_spill_code(il, {'c', 'e'})
+    register_allocation.update_graph_after_spill(il, set_graph, {'c', 'e'})
+    register_allocation.update_graph_after_spill(il, matrix_graph, {'c', 'e'})
+
+    rebuilt = {frozenset(edge) for edge in register_allocation.build_graph(il).edges()}
+    assert {frozenset(edge) for edge in set_graph.edges()} == rebuilt
+    assert {frozenset(edge) for edge in matrix_graph.edges()} == rebuilt
+
+    # Only the blocks that mention a spilled register are replayed
+    il = benchmarks.many_block_il(200)
+    graph = register_allocation.build_graph(il)
+    spilled = {'r3', 'r50', 'r150'}
+    register_allocation.insert_spill_code(il, spilled)
+    register_allocation.update_graph_after_spill(il, graph, spilled)
+
+    rebuilt = {frozenset(edge) for edge in register_allocation.build_graph(il).edges()}
+    assert {frozenset(edge) for edge in graph.edges()} == rebuilt
+
+
+def test_allocate_stats():
+    il = IntermediateLanguage([
+        Instruction(
+            'bb',
+            [Dec('b', False), Dec('c', False), Dec('f', False)],
+            [],
+            frequency=1
+        ),
+        Instruction(
+            'a := b + c',
+            [Dec('a', False)],
+            [Use('b', True), Use('c', False)]
+        ),
+        Instruction(
+            'copy',
+            [Dec('d', False)],
+            [Use('a', True)]
+        ),
+        Instruction(
+            'e := d + f',
+            [Dec('e', False)],
+            [Use('d', False), Use('f', False)]
+        ),
+
+        Instruction(
+            'bb',
+            [Dec('c', False), Dec('e', False)],
+            [],
+            frequency=0.75
+        ),
+        Instruction(
+            'f := 2 + e',
+            [Dec('f', False)],
+            [Use('e', True)]
+        ),
+
+        Instruction(
+            'bb',
+            [Dec('c', False), Dec('d', False), Dec('e', False), Dec('f', False)],
+            [],
+            frequency=0.25
+        ),
+        Instruction(
+            'b := d + e',
+            [Dec('b', False)],
+            [Use('d', True), Use('e', False)]
+        ),
+        Instruction(
+            'e := e - 1',
+            [Dec('e', False)],
+            [Use('e', True)]
+        ),
+
+        Instruction(
+            'bb',
+            [Dec('c', False), Dec('f', False)],
+            [],
+            frequency=1
+        ),
+        Instruction(
+            'b := f + c',
+            [Dec('b', True)],
+            [Use('c', False), Use('f', False)]
+        ),
+    ])
+    phases = []
+    stats = register_allocation.AllocationStats(on_phase=lambda name, seconds, s: phases.append(name))
+
+    graph, coloring = register_allocation.allocate(il, ['red', 'blue', 'yellow'], stats=stats)
+
+    assert coloring is not None
+    assert stats.spill_rounds == 1
+    assert stats.spill_candidates >= 1
+    assert stats.reloads_inserted >= 1
+    assert stats.coalesce_iterations == 1
+    assert stats.edges_added > 0
+    assert stats.simplify_steps > 0
+    assert set(stats.phase_seconds) == set(phases)
+    assert phases[:3] == ['build_graph', 'coalesce_nodes', 'color_graph']
+    assert 'update_graph_after_spill' in phases
+    assert 'on_phase' not in stats.as_dict()
+
+
+def test_solve_liveness_with_loop():
+    # Block 0 falls into the loop in block 1, which either repeats or exits to block 2
+    il = IntermediateLanguage([
+        Instruction(
+            'bb',
+            [],
+            []),
+        Instruction(
+            'n := 10',
+            [Dec('n', False)],
+            []
+        ),
+        Instruction(
+            's := 0',
+            [Dec('s', False)],
+            []
+        ),
+        Instruction(
+            'bb',
+            [],
+            [],
+            frequency=10
+        ),
+        Instruction(
+            's := s + n',
+            [Dec('s', False)],
+            [Use('s', True), Use('n', False)]
+        ),
+        Instruction(
+            'n := n - 1',
+            [Dec('n', False)],
+            [Use('n', True)]
+        ),
+        Instruction(
+            'bb',
+            [],
+            []),
+        Instruction(
+            'ret',
+            [],
+            [Use('s', True)]
+        )
+    ])
+    cfg = register_allocation.ControlFlowGraph([[1], [1, 2], []])
+
+    live_in, live_out = register_allocation.solve_liveness(il, cfg)
+
+    assert live_in == [set(), {'n', 's'}, {'s'}]
+    assert live_out == [{'n', 's'}, {'n', 's'}, set()]
+    assert cfg.postorder() == [2, 1, 0]
+
+    graph = register_allocation.build_graph(il, live_in=live_in)
+    assert graph.contains_edge('n', 's')
+
+    register_allocation.annotate_live_in(il, live_in)
+    assert [dec.reg for dec in il.instructions[3].dec] == ['n', 's']
+    graph, coloring = register_allocation.allocate(il, ['red', 'blue'], cfg=cfg)
+    assert coloring['n'] != coloring['s']
+
+
+def test_color_graph_optimistic():
+    # Every node of a 4-cycle has degree 2, so pessimistic simplify gets stuck with two colors
+    graph = Graph()
+    graph.add_edge('a', 'b')
+    graph.add_edge('b', 'c')
+    graph.add_edge('c', 'd')
+    graph.add_edge('d', 'a')
+    nodes = ['a', 'b', 'c', 'd']
+    cost = {'a': 1, 'b': 2, 'c': 3, 'd': 4}
+
+    assert register_allocation.color_graph(graph, nodes, ['red', 'blue']) is None
+
+    coloring, spilled = register_allocation.color_graph_optimistic(graph, nodes, ['red', 'blue'], cost)
+
+    assert spilled == set()
+    assert all(coloring[x] != coloring[y] for x, y in graph.edges())
+
+    graph.add_edge('a', 'c')
+    coloring, spilled = register_allocation.color_graph_optimistic(graph, nodes, ['red', 'blue'], cost)
+
+    assert len(spilled) == 1
+    assert all(coloring[x] != coloring[y] for x, y in graph.edges() if x in coloring and y in coloring)
+
+
+def test_degree_worklist_by_degree():
+    # A 4-clique p q r s with a pendant t on p, so with three colors only t is simplifiable
+    graph = Graph()
+    for x, y in [('p', 'q'), ('p', 'r'), ('p', 's'), ('q', 'r'), ('q', 's'), ('r', 's'), ('p', 't')]:
+        graph.add_edge(x, y)
+    cost = {'p': 4, 'q': 3.9, 'r': 3.9, 's': 3.9, 't': 1}
+
+    by_cost = register_allocation.DegreeWorklist(graph, sorted(cost), 3, cost)
+    by_degree = register_allocation.DegreeWorklist(graph, sorted(cost), 3, cost, by_degree=True)
+
+    by_cost.remove('t')
+    assert by_cost.cheapest_node() == 'q'
+    # p costs 4 for 4 neighbors, the cheapest per neighbor until removing t leaves it 3
+    assert by_degree.cheapest_node() == 'p'
+    by_degree.remove('t')
+    assert by_degree.cheapest_node() == 'q'
+
+
+def test_allocate_repeats_spill_rounds():
+    # Spilling with four colors leaves reload temporaries that interfere, so one round is not enough
+    colors = ['red', 'blue', 'yellow', 'green']
+
+    graph, coloring = register_allocation.allocate(benchmarks.straight_line_il(100), colors, max_spill_rounds=1)
+    assert coloring is None
+
+    for optimistic in [False, True]:
+        stats = register_allocation.AllocationStats()
+        spilled_il = benchmarks.straight_line_il(100)
+        graph, coloring = register_allocation.allocate(spilled_il, colors, stats=stats, optimistic=optimistic)
+
+        assert coloring is not None
+        assert stats.spill_rounds > 1
+        assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(spilled_il).edges())
+
+
+def test_seeded_allocation_is_repeatable_across_processes():
+    script = '\n'.join([
+        'import benchmarks, register_allocation',
+        'colors = ["c{}".format(i) for i in range(4)]',
+        'for optimistic in [False, True]:',
+        '    _, coloring = register_allocation.allocate(benchmarks.many_block_il(200), colors, optimistic=optimistic,',
+        '                                               seed=7)',
+        '    print(sorted(coloring.items()))',
+    ])
+
+    outputs = set()
+    for hash_seed in ['1', '2']:
+        environment = dict(os.environ, PYTHONHASHSEED=hash_seed)
+        outputs.add(subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True,
+                                   env=environment, cwd=os.path.dirname(os.path.abspath(__file__))).stdout)
+
+    assert len(outputs) == 1
+
+
+def test_insert_split_code_keeps_memory_traffic_out_of_hot_blocks():
+    il = IntermediateLanguage([
+        Instruction('bb', [Dec('a', False), Dec('b', False)], [], frequency=10),
+        Instruction('c := a + b', [Dec('c', False)], [Use('a', False), Use('b', False)]),
+        Instruction('a := a + c', [Dec('a', False)], [Use('a', True), Use('c', True)]),
+        Instruction('d := a + b', [Dec('d', False)], [Use('a', False), Use('b', True)]),
+        Instruction('bb', [Dec('a', False), Dec('d', False)], [], frequency=1),
+        Instruction('e := a + d', [Dec('e', False)], [Use('a', False), Use('d', True)]),
+        Instruction('f := a + e', [Dec('f', False)], [Use('a', True), Use('e', True)]),
+        Instruction('ret', [], [Use('f', True)])
+    ])
+    everywhere_cost = register_allocation.spill_everywhere_cost(il, {'a'})
+
+    reloads, spills, pieces = register_allocation.insert_split_code(il, {'a'}, hot_frequency=5)
+
+    assert pieces == {'a@0': 'a'}
+    assert (reloads, spills) == (3, 1)
+    assert [instruction.opcode for instruction in il.instructions[:6]] == [
+        'bb', 'reload', 'c := a + b', 'a := a + c', 'spill', 'd := a + b']
+    assert register_allocation.memory_traffic(il) == 22 < everywhere_cost == 42
+    # The rewritten IL still has balanced liveness
+    assert register_allocation.build_graph(il).contains_edge('a@0', 'b')
+
+
+def test_allocate_with_split_mode_reports_weighted_cost():
+    colors = ['c{}'.format(i) for i in range(6)]
+    stats = register_allocation.AllocationStats()
+    il = benchmarks.many_block_il(300)
+
+    graph, coloring = register_allocation.allocate(il, colors, stats=stats, spill_mode='split', seed=0)
+
+    assert coloring is not None
+    assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(il).edges())
+    assert 0 < stats.spill_cost < stats.spill_cost_everywhere
+
+
+def test_eliminate_redundant_memory_ops():
+    il = IntermediateLanguage([
+        Instruction('bb', [Dec('a', False)], [], frequency=2),
+        Instruction('b := a + 1', [Dec('b', False)], [Use('a', False)]),
+        Instruction('c := a + b', [Dec('c', False)], [Use('a', False), Use('b', True)]),
+        Instruction('a := c', [Dec('a', False)], [Use('c', True)]),
+        Instruction('a := a + 1', [Dec('a', False)], [Use('a', True)]),
+        Instruction('ret', [], [Use('a', True)])
+    ])
+    register_allocation.insert_spill_code(il, {'a'})
+
+    removed, weighted, lengthened = register_allocation.eliminate_redundant_memory_ops(il, {'a'})
+
+    # Every reload after the first reuses the value still in the register and the first spill is overwritten
+    assert (removed, weighted, lengthened) == (4, 8, {'a'})
+    assert [instruction.opcode for instruction in il.instructions] == [
+        'bb', 'reload', 'b := a + 1', 'c := a + b', 'a := c', 'a := a + 1', 'spill', 'ret']
+    assert register_allocation.build_graph(il).contains_edge('a', 'b')
+
+
+def test_allocate_eliminates_redundant_memory_ops():
+    colors = ['c{}'.format(i) for i in range(4)]
+    stats = register_allocation.AllocationStats()
+    il = benchmarks.straight_line_il(200)
+
+    graph, coloring = register_allocation.allocate(il, colors, stats=stats, eliminate_redundant=True, seed=0)
+
+    assert coloring is not None
+    assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(il).edges())
+    assert stats.memory_ops_removed > 0
+    assert stats.spill_cost == stats.spill_cost_everywhere - stats.memory_cost_removed
+
+
+def test_allocate_respills_registers_lengthened_by_elimination():
+    colors = ['c{}'.format(i) for i in range(3)]
+    il = benchmarks.straight_line_il(30)
+
+    # Keeping reloaded values in registers makes them interfere with each other, so some must be spilled again
+    graph, coloring = register_allocation.allocate(il, colors, eliminate_redundant=True)
+
+    assert coloring is not None
+    assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(il).edges())
+
+
+def test_optimistic_allocation_with_elimination_converges():
+    colors = ['c{}'.format(i) for i in range(3)]
+
+    # Lengthened registers next to a failed node used to fail one per round and exhaust the spill rounds
+    for allocator in ('chaitin', 'linear_scan'):
+        stats = register_allocation.AllocationStats()
+        il = benchmarks.straight_line_il(400, seed=2)
+        graph, coloring = register_allocation.allocate(il, colors, stats=stats, optimistic=True,
+                                                       eliminate_redundant=True, seed=0, allocator=allocator)
+
+        assert coloring is not None
+        assert stats.spill_rounds < register_allocation.MAX_SPILL_ROUNDS
+
+
+def values_read(il, register=lambda reg: reg, memory=lambda reg: reg):
+    """
+    Runs the IL symbolically and returns the values read by every instruction other than spill code, after mapping
+    registers to their storage. Values coming into the function are left out, live-in registers may share a color.
+    """
+    storage = {}
+    values = []
+    for instruction in il.instructions:
+        if instruction.opcode == 'reload':
+            storage[register(instruction.dec[0].reg)] = storage.get(('memory', memory(instruction.dec[0].reg)))
+        elif instruction.opcode == 'spill':
+            storage[('memory', memory(instruction.use[0].reg))] = storage.get(register(instruction.use[0].reg))
+        elif instruction.opcode != 'bb':
+            read = [storage.get(register(use.reg)) for use in instruction.use]
+            values.append(read)
+            for dec in instruction.dec:
+                storage[register(dec.reg)] = read[0] if instruction.opcode == 'copy' else len(values)
+    return values
+
+
+def test_allocate_with_split_mode_and_elimination_keeps_values():
+    colors = ['c{}'.format(i) for i in range(3)]
+
+    for seed in range(3):
+        il = benchmarks.many_block_il(30, seed=seed)
+        expected = values_read(il)
+
+        # Block-local registers share the memory of the register they were split from, whose spills must stay
+        graph, coloring = register_allocation.allocate(il, colors, spill_mode='split', eliminate_redundant=True,
+                                                       seed=0)
+
+        assert coloring is not None
+        assert values_read(il, coloring.get, lambda reg: reg.split('@')[0]) == expected
+
+
+def remat_il():
+    return IntermediateLanguage([
+        Instruction('bb', [Dec('p', False)], [], frequency=1),
+        Instruction('k := 4', [Dec('k', False)], [], rematerializable=True),
+        Instruction('x := p + 8', [Dec('x', False)], [Use('p', False)], rematerializable=True),
+        Instruction('a := p + k', [Dec('a', False)], [Use('p', False), Use('k', False)]),
+        Instruction('bb', [Dec('a', False), Dec('k', False), Dec('p', False), Dec('x', False)], [], frequency=10),
+        Instruction('b := a * k', [Dec('b', False)], [Use('a', True), Use('k', False)]),
+        Instruction('c := b + x', [Dec('c', False)], [Use('b', True), Use('x', True)]),
+        Instruction('d := c + p', [Dec('d', False)], [Use('c', True), Use('p', True)]),
+        Instruction('ret', [], [Use('d', True), Use('k', True)])
+    ])
+
+
+def test_rematerializable_registers_are_cheaper():
+    il = remat_il()
+
+    assert set(register_allocation.rematerializable_registers(il)) == {'k', 'x'}
+    cost = register_allocation.estimate_spill_costs(il)
+    assert cost['k'] == register_allocation.REMAT_COST * 21
+    assert cost['x'] == register_allocation.REMAT_COST * 10
+    assert cost['a'] == 11
+
+    graph = register_allocation.build_graph(il)
+    assert register_allocation.decide_spills(il, graph, ['red', 'blue', 'yellow'], cost) == {'x'}
+
+
+def test_insert_remat_code():
+    il = remat_il()
+
+    reloads, spills, remats = register_allocation.insert_remat_code(il, {'k', 'a'})
+
+    # k is recomputed before its three uses while a still goes through memory
+    assert (reloads, spills, remats) == (1, 1, 3)
+    assert [instruction.opcode for instruction in il.instructions].count('k := 4') == 4
+    assert all(instruction.rematerializable for instruction in il.instructions if instruction.opcode == 'k := 4')
+    assert not register_allocation.build_graph(il).contains_edge('k', 'b')
+
+
+def test_allocate_with_remat_mode():
+    for spill_mode in ['everywhere', 'remat']:
+        stats = register_allocation.AllocationStats()
+        il = remat_il()
+        graph, coloring = register_allocation.allocate(il, ['red', 'blue', 'yellow'], stats=stats,
+                                                       spill_mode=spill_mode, seed=0)
+
+        assert coloring is not None
+        assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(il).edges())
+        if spill_mode == 'remat':
+            assert stats.remats_inserted > 0
+            assert stats.spill_cost < stats.spill_cost_everywhere
+
+
+def test_iterated_register_coalescing_is_conservative():
+    # Coalescing the copy merges b into a, which then also interferes with c and makes a, c, d and e a 4-clique
+    def il():
+        return IntermediateLanguage([
+            Instruction('bb', [Dec('a', False), Dec('c', False)], []),
+            Instruction('d := a + c', [Dec('d', False)], [Use('a', False), Use('c', False)]),
+            Instruction('e := d', [Dec('e', False)], [Use('d', False)]),
+            Instruction('x := d + e', [Dec('x', False)], [Use('d', True), Use('e', True)]),
+            Instruction('copy', [Dec('b', False)], [Use('a', True)]),
+            Instruction('y := b + c', [Dec('y', False)], [Use('b', True), Use('c', True)]),
+            Instruction('ret', [], [Use('x', True), Use('y', True)])
+        ])
+    colors = ['red', 'blue', 'yellow']
+
+    graph, coloring = register_allocation.color_il(il(), colors)
+    assert coloring is None
+
+    conservative_il = il()
+    graph = register_allocation.build_graph(conservative_il)
+    cost = register_allocation.estimate_spill_costs(conservative_il)
+    coloring, spilled = register_allocation.iterated_register_coalescing(conservative_il, graph, colors, cost, seed=0)
+
+    assert spilled == set()
+    assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(conservative_il).edges())
+
+
+def test_allocate_with_irc():
+    colors = ['c{}'.format(i) for i in range(4)]
+    stats = register_allocation.AllocationStats()
+    il = benchmarks.copy_heavy_il(200)
+
+    graph, coloring = register_allocation.allocate(il, colors, stats=stats, allocator='irc', seed=0)
+
+    assert coloring is not None
+    assert stats.coalesce_iterations > 0
+    assert 'iterated_register_coalescing' in stats.phase_seconds
+    assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(il).edges())
+
+
+def test_allocate_with_irc_keeps_spill_code_uncoalesced():
+    colors = ['c{}'.format(i) for i in range(3)]
+
+    # Coalescing reload temporaries made nodes that failed in select but could not be spilled again
+    for spill_mode in ('everywhere', 'split', 'remat'):
+        il = benchmarks.copy_heavy_il(400, seed=1)
+        graph, coloring = register_allocation.allocate(il, colors, allocator='irc', spill_mode=spill_mode, seed=0)
+
+        assert coloring is not None
+        assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(il).edges())
+
+
+def test_allocate_with_split_mode_never_coalesces_spill_code():
+    colors = ['c{}'.format(i) for i in range(4)]
+    il = benchmarks.many_block_il(120, seed=1)
+    expected = values_read(il)
+
+    # Coalescing a block-local register into another register would store it into the memory of the other one
+    graph, coloring = register_allocation.allocate(il, colors, allocator='irc', spill_mode='split', seed=0)
+
+    assert coloring is not None
+    assert values_read(il, coloring.get, lambda reg: reg.split('@')[0]) == expected
+
+
+def test_color_graph_chordal():
+    # Two triangles sharing the edge b-c
+    chordal = Graph()
+    for x, y in [('a', 'b'), ('a', 'c'), ('b', 'c'), ('b', 'd'), ('c', 'd')]:
+        chordal.add_edge(x, y)
+    stats = register_allocation.AllocationStats()
+
+    order, clique = register_allocation.maximum_cardinality_search(chordal, chordal.nodes())
+    assert clique == 3
+    assert register_allocation.is_perfect_elimination_order(chordal, order)
+
+    coloring, clique = register_allocation.color_graph_chordal(chordal, chordal.nodes(), ['red', 'blue', 'yellow'],
+                                                               stats)
+    assert clique == 3 and stats.max_clique == 3
+    assert all(coloring[x] != coloring[y] for x, y in chordal.edges())
+    assert register_allocation.color_graph_chordal(chordal, chordal.nodes(), ['red', 'blue']) == (None, 3)
+
+    # A chordless 4-cycle
+    cycle = Graph()
+    for x, y in [('a', 'b'), ('b', 'c'), ('c', 'd'), ('d', 'a')]:
+        cycle.add_edge(x, y)
+    order, _ = register_allocation.maximum_cardinality_search(cycle, cycle.nodes())
+    assert not register_allocation.is_perfect_elimination_order(cycle, order)
+    assert register_allocation.color_graph_chordal(cycle, cycle.nodes(), ['red', 'blue']) == (None, None)
+
+
+def test_allocate_with_chordal():
+    # Every register is defined once, so the interference graph is an interval graph
+    def il():
+        return IntermediateLanguage([
+            Instruction('bb', [Dec('a', False)], []),
+            Instruction('b := a + 1', [Dec('b', False)], [Use('a', False)]),
+            Instruction('c := a + b', [Dec('c', False)], [Use('a', False), Use('b', False)]),
+            Instruction('d := a + b + c', [Dec('d', False)], [Use('a', True), Use('b', True), Use('c', False)]),
+            Instruction('e := c + d', [Dec('e', False)], [Use('c', True), Use('d', True)]),
+            Instruction('ret', [], [Use('e', True)])
+        ])
+
+    stats = register_allocation.AllocationStats()
+    graph, coloring = register_allocation.allocate(il(), ['red', 'blue', 'yellow'], stats=stats, allocator='chordal')
+    assert stats.max_clique == 3
+    assert 'coalesce_nodes' not in stats.phase_seconds
+    assert all(coloring[x] != coloring[y] for x, y in graph.edges())
+
+    # The pressure is known without attempting a coloring
+    stats = register_allocation.AllocationStats()
+    graph, coloring = register_allocation.allocate(il(), ['red', 'blue'], stats=stats, allocator='chordal',
+                                                   max_spill_rounds=0)
+    assert coloring is None
+    assert stats.max_clique == 3
+
+
+def test_live_intervals():
+    il = IntermediateLanguage([
+        Instruction('bb', [Dec('a', False)], []),
+        Instruction('b := a + 1', [Dec('b', False)], [Use('a', True)]),
+        Instruction('bb', [Dec('b', False)], []),
+        Instruction('c := b', [Dec('c', False)], [Use('b', True)]),
+        Instruction('bb', [Dec('a', False)], []),
+        Instruction('ret', [], [Use('a', True)])
+    ])
+
+    intervals = register_allocation.live_intervals(il)
+
+    # b is defined where a dies without overlapping it, and a has a hole while the second block runs
+    assert list(zip(intervals['a'].starts, intervals['a'].ends)) == [(1, 2), (9, 10)]
+    assert list(zip(intervals['b'].starts, intervals['b'].ends)) == [(3, 6)]
+    assert list(zip(intervals['c'].starts, intervals['c'].ends)) == [(7, 8)]
+
+    cost = register_allocation.estimate_spill_costs(il)
+    coloring, spilled = register_allocation.linear_scan(il, ['red'], cost)
+    assert spilled == set()
+    assert set(coloring.values()) == {'red'}
+
+
+def test_allocate_with_linear_scan():
+    colors = ['c{}'.format(i) for i in range(8)]
+    stats = register_allocation.AllocationStats()
+    il = benchmarks.many_block_il(500)
+
+    graph, coloring = register_allocation.allocate(il, colors, stats=stats, allocator='linear_scan')
+
+    assert graph is None
+    assert coloring is not None
+    assert stats.spill_rounds > 0
+    assert 'build_graph' not in stats.phase_seconds
+    assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(il).edges())
+
+
+def test_linear_scan_falls_back_to_graph_coloring():
+    colors = ['c{}'.format(i) for i in range(3)]
+    stats = register_allocation.AllocationStats()
+    il = benchmarks.straight_line_il(120, seed=2)
+
+    # First fit gets stuck on the holes of a reloaded register, which cannot be spilled again
+    graph, coloring = register_allocation.allocate(il, colors, stats=stats, allocator='linear_scan')
+
+    assert graph is not None
+    assert coloring is not None
+    assert 'linear_scan' in stats.phase_seconds
+    assert all(coloring[x] != coloring[y] for x, y in register_allocation.build_graph(il).edges())
+
+
+def test_choose_allocator():
+    il = benchmarks.straight_line_il(100)
+
+    assert register_allocation.choose_allocator(il) == 'chaitin'
+    assert register_allocation.choose_allocator(il, threshold=len(il.instructions)) == 'linear_scan'
+    graph, coloring = register_allocation.allocate(il, ['c{}'.format(i) for i in range(8)], allocator='auto')
+    assert graph is not None and coloring is not None
+
+
+def test_build_graph_parallel():
+    def edges(graph):
+        return {frozenset(edge) for edge in graph.edges()}
+
+    il = benchmarks.many_block_il(300)
+    expected = edges(register_allocation.build_graph(il))
+
+    assert edges(register_allocation.build_graph_parallel(il, processes=2, threshold=0)) == expected
+    # Small functions, a single worker and a single block stay on the serial path
+    assert edges(register_allocation.build_graph_parallel(il, processes=2)) == expected
+    assert edges(register_allocation.build_graph_parallel(il, processes=1, threshold=0)) == expected
+    straight_line = benchmarks.straight_line_il(100)
+    assert (edges(register_allocation.build_graph_parallel(straight_line, processes=2, threshold=0)) ==
+            edges(register_allocation.build_graph(straight_line)))
+
+    compact = register_allocation.CompactIntermediateLanguage.from_il(il)
+    live_in = [[dec.reg for dec in instruction.dec if not dec.dead]
+               for instruction in il.instructions if instruction.opcode == 'bb']
+    graph = register_allocation.build_graph_parallel(compact, register_allocation.BitMatrixAdjacency, live_in,
+                                                     processes=2, threshold=0)
+    assert edges(graph) == expected
+
+
+def test_graph_overlay():
+    graph = Graph()
+    graph.add_edge('a', 'b')
+    graph.add_edge('a', 'c')
+    graph.add_edge('b', 'c')
+    graph.add_edge('c', 'd')
+    overlay = register_allocation.GraphOverlay(graph)
+
+    assert overlay.remove_node('c') == {'a': 1, 'b': 1, 'd': 0}
+    checkpoint = overlay.checkpoint()
+    overlay.remove_node('a')
+
+    assert 'a' not in overlay and 'b' in overlay
+    assert overlay.degree('b') == 0 and overlay.degree('d') == 0
+    assert overlay.neighbors('b') == []
+    assert not overlay.contains_edge('a', 'b')
+    assert sorted(overlay.nodes()) == ['b', 'd']
+    assert overlay.removed() == ['c', 'a']
+
+    overlay.rollback(checkpoint)
+    assert overlay.degree('b') == 1 and overlay.contains_edge('a', 'b')
+    overlay.rollback()
+    assert overlay.degree('c') == 3 and sorted(overlay.neighbors('a')) == ['b', 'c']
+
+    # The graph itself is never changed
+    assert graph.degree('c') == 3 and graph.edge_count() == 4